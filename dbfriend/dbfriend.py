@@ -1,19 +1,35 @@
 #!/usr/bin/env python
 import argparse
+import csv
 import datetime
 import getpass
+import gzip
 import hashlib
+import importlib.util
+import io
 import logging
+import logging.handlers
+import multiprocessing
 import os
 import re
-import subprocess
 import sys
+import threading
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from contextlib import contextmanager
+from functools import lru_cache
 from typing import List
 from typing import Set
-import geopandas as gpd
+import numpy as np
 import pandas as pd
 import psycopg2
+import psycopg2.extras
+import psycopg2.sql
+import pyogrio
+import pyproj
+import shapely
 from geopandas import GeoDataFrame
 from rich.console import Console
 from rich.logging import RichHandler
@@ -22,7 +38,6 @@ from rich.progress import Progress
 from rich.progress import SpinnerColumn
 from rich.progress import TextColumn
 from rich.progress import TimeElapsedColumn
-from sqlalchemy import create_engine
 
 # Initialize rich Console
 console = Console(width=100)
@@ -44,6 +59,118 @@ logging.basicConfig(
 )
 logger = logging.getLogger("rich")
 
+# File extensions to process, matched case-insensitively in a single regex search
+SUPPORTED_EXTENSIONS = ('.shp', '.geojson', '.json', '.gpkg', '.kml', '.gml')
+SUPPORTED_FILE_PATTERN = re.compile(
+    r'(?:' + '|'.join(re.escape(ext) for ext in SUPPORTED_EXTENSIONS) + r')$', re.IGNORECASE
+)
+
+# Column name patterns treated as non-essential when comparing attributes
+NON_ESSENTIAL_COLUMN_PATTERNS = (
+    r'^id$',          # Exact match 'id'
+    r'^gid$',         # Exact match 'gid'
+    r'.*_id$',        # Suffix '_id'
+    r'.*_gid$',       # Suffix '_gid'
+    r'^uuid$',        # Exact match 'uuid'
+    r'^created_at$',  # Exact match 'created_at'
+    r'^updated_at$',  # Exact match 'updated_at'
+    r'^.*_at$',       # Suffix '_at'
+)
+NON_ESSENTIAL_COLUMN_PATTERN = re.compile(
+    '|'.join(f'(?:{pattern})' for pattern in NON_ESSENTIAL_COLUMN_PATTERNS), re.IGNORECASE
+)
+
+# SQL types for columns that update_geometries adds to an existing table, by pandas dtype
+UPDATE_COLUMN_TYPES = {
+    'object': 'TEXT',
+    'str': 'TEXT',
+    'int64': 'INTEGER',
+    'int32': 'INTEGER',
+    'float64': 'DOUBLE PRECISION',
+    'float32': 'REAL',
+    'bool': 'BOOLEAN',
+    'datetime64[ns]': 'TIMESTAMP',
+}
+
+# Geometry type families that get an SP-GiST index when a table holds only one of them
+SPGIST_GEOMETRY_FAMILIES = (
+    {'Point', 'MultiPoint', 'LineString', 'MultiLineString'},
+    {'Polygon', 'MultiPolygon'},
+)
+
+# Number of geometries per table whose --coordinates details are also logged to the terminal
+COORDINATES_LOG_LIMIT = 100
+
+# Shapefile components that are hashed along with the .shp itself
+SHAPEFILE_SIDECARS = ('.dbf', '.shx', '.prj', '.cpg')
+
+# Appends of at least this many rows, and at least this fraction of the table's
+# estimated size, rebuild the spatial index instead of maintaining it
+INDEX_REBUILD_THRESHOLD = 50000
+INDEX_REBUILD_FRACTION = 0.1
+
+# Table recording the content digest of every imported file
+IMPORT_LOG_TABLE = 'dbfriend_meta'
+
+# NULL marker for COPY CSV; the default (an unquoted empty field) would also turn empty strings into NULL
+COPY_NULL = r'\N'
+
+# Read through Arrow when pyarrow is installed; it skips the per-column conversion in pyogrio
+USE_ARROW = importlib.util.find_spec("pyarrow") is not None
+
+# Without Arrow, tables made of several files are read in worker processes once those
+# files add up to this many bytes; below it, starting the workers costs more than it saves
+PROCESS_READ_THRESHOLD = 100 * 1024 * 1024
+
+@lru_cache(maxsize=None)
+def epsg_of(crs_wkt: str):
+    """Resolve the EPSG code of a CRS given as WKT, caching the PROJ database lookup."""
+    return pyproj.CRS.from_wkt(crs_wkt).to_epsg()
+
+def get_epsg(crs):
+    """Return the EPSG code of a CRS, or None if there is no CRS or no matching code."""
+    if crs is None:
+        return None
+    return epsg_of(crs.to_wkt())
+
+@lru_cache(maxsize=32)
+def transformer_for(source_wkt: str, target_wkt: str):
+    """
+    Build the Transformer between two CRSs given as WKT, caching it per CRS pair.
+
+    Creating the PROJ pipeline is the slow part of a reprojection, and files in
+    one run usually share their CRS. Transformers are thread-safe since pyproj 3.1.
+    """
+    return pyproj.Transformer.from_crs(source_wkt, target_wkt, always_xy=True)
+
+def reproject_geodataframe(gdf, crs):
+    """
+    Reproject a GeoDataFrame with one PROJ call over all of its coordinates.
+
+    Args:
+        gdf: GeoDataFrame with a CRS set
+        crs: Target CRS, as an EPSG code or anything pyproj accepts
+
+    Returns:
+        GeoDataFrame in the target CRS
+    """
+    target_crs = pyproj.CRS.from_user_input(crs)
+    transformer = transformer_for(gdf.crs.to_wkt(), target_crs.to_wkt())
+
+    # 2D and 3D geometries are transformed separately so 2D ones do not pick up NaN heights
+    geoms = gdf.geometry.to_numpy().copy()
+    has_z = shapely.has_z(geoms)
+    for mask, include_z in ((~has_z, False), (has_z, True)):
+        if mask.any():
+            geoms[mask] = shapely.transform(
+                geoms[mask], transformer.transform, include_z=include_z, interleaved=False
+            )
+    return gdf.set_geometry(geoms, crs=target_crs)
+
+def format_number(n: int) -> str:
+    """Format an integer with spaces as thousands separators, e.g. 12 345."""
+    return f"{n:_}".replace('_', ' ')
+
 def quote_identifier(name: str) -> str:
     """
     Safely quote a database identifier (table name, column name, etc.)
@@ -68,6 +195,15 @@ def quote_identifier(name: str) -> str:
     # Double quote the identifier and escape any existing quotes
     return '"' + name.replace('"', '""') + '"'
 
+def column_list(columns):
+    """
+    Quote column names as a comma-separated psycopg2.sql list.
+
+    Unlike quote_identifier this accepts any name, as column names come from
+    the input files and may hold spaces or non-ASCII letters.
+    """
+    return psycopg2.sql.SQL(', ').join(psycopg2.sql.Identifier(col) for col in columns)
+
 def build_update_statement(table_name: str, schema: str, columns: List[str], where_clause: str) -> tuple[str, list]:
     """
     Safely build an UPDATE statement with proper quoting and parameterization.
@@ -99,8 +235,20 @@ def build_update_statement(table_name: str, schema: str, columns: List[str], whe
     
     return sql
 
-def print_geometry_details(row, status="", coordinates_enabled=False):
-    """Print coordinates and attributes for a geometry."""
+def format_coordinates(geoms):
+    """Format the XY coordinates of one or more geometries as '(x, y)' lines in a single vectorized pass."""
+    buffer = io.StringIO()
+    np.savetxt(buffer, shapely.get_coordinates(geoms), fmt='(%.6f, %.6f)')
+    return buffer.getvalue().splitlines()
+
+def print_geometry_details(row, status="", coordinates_enabled=False, details_file=None, log=True):
+    """
+    Print coordinates and attributes for a geometry.
+
+    The output is also appended to geometry_details.txt, or written to
+    details_file when the caller already holds it open. Pass log=False to
+    write the details to the file only.
+    """
     if not coordinates_enabled:  # Skip if flag not set
         # Still log basic info without coordinates
         if isinstance(row, dict):
@@ -130,32 +278,53 @@ def print_geometry_details(row, status="", coordinates_enabled=False):
     
     if geom.geom_type == 'Point':
         output_lines.append(f"Coordinates: ({geom.x:.6f}, {geom.y:.6f})")
+    elif geom.geom_type == 'Polygon':
+        # Fetch all rings' coordinates in one call and split them per ring
+        rings = shapely.get_rings(geom)
+        lines = format_coordinates(rings)
+        offsets = np.cumsum(shapely.get_num_coordinates(rings))
+        output_lines.append("Coordinates:")
+        output_lines.extend(lines[:offsets[0]])
+        for i, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+            output_lines.append(f"Interior Ring {i+1} Coordinates:")
+            output_lines.extend(lines[start:end])
     else:
-        if hasattr(geom, 'exterior'):
-            coords = list(geom.exterior.coords)
-            output_lines.append("Coordinates:")
-            # Format each coordinate pair individually
-            for x, y in coords:
-                output_lines.append(f"({x:.6f}, {y:.6f})")
-            
-            if geom.interiors:
-                for i, interior in enumerate(geom.interiors):
-                    output_lines.append(f"Interior Ring {i+1} Coordinates:")
-                    for x, y in interior.coords:
-                        output_lines.append(f"({x:.6f}, {y:.6f})")
-        else:
-            coords = list(geom.coords)
-            output_lines.append("Coordinates:")
-            for x, y in coords:
-                output_lines.append(f"({x:.6f}, {y:.6f})")
+        output_lines.append("Coordinates:")
+        output_lines.extend(format_coordinates(geom))
     
-    # Output to terminal
-    for line in output_lines:
-        logger.info(line)
+    details = '\n'.join(output_lines)
+
+    # Output to terminal as one record (skip the formatting unless it will be logged)
+    if log and logger.isEnabledFor(logging.INFO):
+        logger.info(details)
     
     # Output to file
+    if details_file is not None:
+        details_file.write(details + '\n')
+        return
     with open('geometry_details.txt', 'a', encoding='utf-8') as f:
-        f.write('\n'.join(output_lines) + '\n')
+        f.write(details + '\n')
+
+def write_geometry_details(gdf, status=""):
+    """
+    Write the details of every geometry in a GeoDataFrame to geometry_details.txt.
+
+    Rows are walked as plain tuples rather than boxed Series, and only the first
+    COORDINATES_LOG_LIMIT geometries are echoed to the terminal.
+
+    Args:
+        gdf: GeoDataFrame whose rows to write
+        status: Label printed with each geometry (e.g. "NEW")
+    """
+    columns = list(gdf.columns)
+    # Open the details file once rather than once per geometry
+    with open('geometry_details.txt', 'a', encoding='utf-8') as details_file:
+        for i, values in enumerate(gdf.itertuples(index=False, name=None)):
+            print_geometry_details(dict(zip(columns, values)), status, True, details_file,
+                                   log=i < COORDINATES_LOG_LIMIT)
+    if len(gdf) > COORDINATES_LOG_LIMIT:
+        logger.info(f"Details of the remaining {format_number(len(gdf) - COORDINATES_LOG_LIMIT)} "
+                    "geometries were written to geometry_details.txt")
 
 def parse_arguments():
     help_text = """
@@ -182,6 +351,21 @@ Options:
                       If the table does not exist, it will be created.
     --coordinates     Print coordinates and attributes for each geometry.
     --no-backup       Do not create backups of existing tables before modifying them.
+    --jobs            Number of tables to load in parallel (default: 1). Each table is
+                      committed separately.
+    --spgist          Build SP-GiST instead of GiST spatial indexes. SP-GiST is used
+                      automatically for tables with only (multi)points and (multi)linestrings,
+                      or only (multi)polygons. Requires PostGIS 2.5+; older versions fall back to GiST.
+    --union           Merge files with the same attributes and CRS into one table named
+                      after their common prefix (e.g. roads_01, roads_02 -> roads).
+    --force           Re-import files even if they are unchanged since their last import.
+                      The dbfriend_meta digest table is neither read nor written.
+    --maintenance-work-mem
+                      Memory PostgreSQL may use for spatial index builds during the load
+                      (default: 1GB).
+    --rebuild-index   Drop the spatial index of existing tables before appending and rebuild
+                      it afterwards, whatever the batch size. By default this is only done
+                      for appends of 50 000+ rows that grow the table by 10% or more.
     
 Note: Password will be prompted securely or can be set via DB_PASSWORD environment variable.
 """
@@ -221,6 +405,18 @@ Note: Password will be prompted securely or can be set via DB_PASSWORD environme
                        help='Target table name. If specified, all data will be loaded into this table')
     parser.add_argument('--no-backup', action='store_true',
                        help='Do not create backups of existing tables before modifying them')
+    parser.add_argument('--jobs', type=int, default=1,
+                       help='Number of tables to load in parallel (default: 1)')
+    parser.add_argument('--spgist', action='store_true',
+                       help='Build SP-GiST instead of GiST spatial indexes')
+    parser.add_argument('--union', action='store_true',
+                       help='Merge files with the same attributes and CRS into one table')
+    parser.add_argument('--force', action='store_true',
+                       help='Re-import files even if they are unchanged since their last import')
+    parser.add_argument('--maintenance-work-mem', type=memory_setting, default='1GB',
+                       help='Memory for spatial index builds during the load (default: 1GB)')
+    parser.add_argument('--rebuild-index', action='store_true',
+                       help='Rebuild the spatial index of existing tables around every append')
 
     return parser.parse_args()
 
@@ -239,6 +435,30 @@ def connect_db(dbname, dbuser, host, port, password):
         logger.error(f"Database connection failed: {e}")
         sys.exit(1)
 
+def configure_bulk_session(conn, maintenance_work_mem='1GB'):
+    """
+    Relax durability settings for the bulk load session.
+
+    Commits no longer wait for the WAL flush, which is safe here since a failed
+    run can simply be repeated. maintenance_work_mem sizes the spatial index
+    builds, which dominate the time spent finalizing a load.
+
+    Args:
+        conn: Database connection
+        maintenance_work_mem: Memory for index builds, as a PostgreSQL size (e.g. '1GB')
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SET synchronous_commit = off;")
+        cursor.execute("SET work_mem = '256MB';")
+        cursor.execute("SET maintenance_work_mem = %s;", (maintenance_work_mem,))
+
+def memory_setting(value):
+    """argparse type for PostgreSQL memory sizes such as 512MB or 2GB."""
+    value = value.replace(' ', '')
+    if not re.match(r'^\d+(kB|MB|GB|TB)?$', value):
+        raise argparse.ArgumentTypeError(f"invalid memory size: '{value}' (expected e.g. 512MB or 2GB)")
+    return value
+
 def get_existing_tables(conn, schema='public'):
     with conn.cursor() as cursor:
         cursor.execute("""
@@ -246,7 +466,7 @@ def get_existing_tables(conn, schema='public'):
             FROM information_schema.tables
             WHERE table_schema = %s;
         """, (schema,))
-        tables = [row[0] for row in cursor.fetchall()]
+        tables = {row[0] for row in cursor.fetchall()}
     return tables
 
 def identify_affected_tables(file_info_list, args, schema='public'):
@@ -263,6 +483,33 @@ def identify_affected_tables(file_info_list, args, schema='public'):
     
     return affected_tables
 
+def assign_union_tables(file_info_list):
+    """
+    Point files that share attributes and CRS at one common table.
+
+    Files are grouped by their sorted field names and CRS. Each group with more
+    than one file is loaded into a table named after the common prefix of the
+    file names, with trailing tile numbers and separators stripped (roads_01,
+    roads_02 -> roads). Groups without a usable prefix keep the first file's name.
+
+    Args:
+        file_info_list: File info dicts with 'table_name', 'fields' and 'crs' keys
+    """
+    groups = defaultdict(list)
+    for info in file_info_list:
+        groups[(info['fields'], info['crs'])].append(info)
+
+    for infos in groups.values():
+        if len(infos) < 2:
+            continue
+        names = sorted(info['table_name'] for info in infos)
+        union_name = os.path.commonprefix(names).rstrip('_- 0123456789')
+        if not re.match(r'^[A-Za-z_][A-Za-z0-9_]*$', union_name):
+            union_name = names[0]
+        logger.info(f"Merging {len(infos)} files into table '[cyan]{union_name}[/]'")
+        for info in infos:
+            info['table_name'] = union_name
+
 def manage_old_backups(backup_dir, table_name):
     """Keep only the last 3 file backups for a given table."""
     try:
@@ -271,7 +518,7 @@ def manage_old_backups(backup_dir, table_name):
         
         # Find all backup files for this table
         backup_files = [f for f in os.listdir(backup_dir) 
-                       if f.startswith(f"{table_name}_backup_") and f.endswith('.sql')]
+                       if f.startswith(f"{table_name}_backup_") and f.endswith(('.sql.gz', '.dump', '.sql'))]
         backup_files.sort(reverse=True)
         
         # Remove all but the last 3 backups
@@ -282,8 +529,118 @@ def manage_old_backups(backup_dir, table_name):
     except Exception as e:
         logger.error(f"Error managing old backups: {e}")
 
+def dump_table(cursor, schema, table, backup_file):
+    """
+    Write one table to a gzipped SQL script, streamed with COPY TO STDOUT.
+
+    The script recreates the table with its column defaults, generated and
+    identity columns, primary key, unique and check constraints and indexes,
+    loads the rows in the same text format pg_dump uses and sets the column
+    sequences to their current values, so it restores with
+    `gunzip -c <file> | psql`. Sequences behind serial columns are created if
+    they do not exist. Foreign keys, triggers, grants and comments are not
+    included.
+
+    Args:
+        cursor: Cursor on the connection holding the backup snapshot
+        schema: Database schema
+        table: Name of the table
+        backup_file: Path of the .sql.gz file to write
+    """
+    quoted_table = f"{quote_identifier(schema)}.{quote_identifier(table)}"
+
+    cursor.execute("""
+        SELECT a.attname, format_type(a.atttypid, a.atttypmod), a.attnotnull,
+               pg_get_expr(d.adbin, d.adrelid), a.attidentity, a.attgenerated,
+               pg_get_serial_sequence(%s, a.attname)
+        FROM pg_attribute a
+        LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+        WHERE a.attrelid = %s::regclass
+        AND a.attnum > 0
+        AND NOT a.attisdropped
+        ORDER BY a.attnum
+    """, (quoted_table, quoted_table))
+    columns = cursor.fetchall()
+
+    cursor.execute("""
+        SELECT conname, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE conrelid = %s::regclass
+        AND contype IN ('p', 'u', 'c')
+        ORDER BY conname
+    """, (quoted_table,))
+    constraints = cursor.fetchall()
+
+    # Indexes backing the constraints above are recreated with them
+    cursor.execute("""
+        SELECT pg_get_indexdef(i.indexrelid)
+        FROM pg_index i
+        WHERE i.indrelid = %s::regclass
+        AND NOT EXISTS (
+            SELECT 1 FROM pg_constraint c
+            WHERE c.conrelid = i.indrelid AND c.conindid = i.indexrelid
+        )
+        ORDER BY i.indexrelid
+    """, (quoted_table,))
+    indexes = [row[0] for row in cursor.fetchall()]
+
+    # Column names are not restricted like table names, so they are quoted by psycopg2
+    quoted_columns = {name: psycopg2.sql.Identifier(name).as_string(cursor) for name, *_ in columns}
+
+    column_defs = []
+    serial_sequences = []
+    sequence_values = []
+    for name, sql_type, not_null, default, identity, generated, sequence in columns:
+        column_def = f"{quoted_columns[name]} {sql_type}"
+        if generated:
+            column_def += f" GENERATED ALWAYS AS ({default}) STORED"
+        elif identity:
+            column_def += f" GENERATED {'ALWAYS' if identity == 'a' else 'BY DEFAULT'} AS IDENTITY"
+        elif default is not None:
+            column_def += f" DEFAULT {default}"
+        if not_null:
+            column_def += " NOT NULL"
+        column_defs.append(column_def)
+
+        if sequence:
+            if not identity:
+                serial_sequences.append((sequence, name))
+            cursor.execute(f"SELECT last_value, is_called FROM {sequence}")
+            sequence_values.append((name, *cursor.fetchone()))
+
+    column_defs += [
+        f"CONSTRAINT {psycopg2.sql.Identifier(name).as_string(cursor)} {definition}"
+        for name, definition in constraints
+    ]
+    # Generated columns are rebuilt from the other columns on restore
+    column_list = ", ".join(quoted_columns[name] for name, *_, generated, _ in columns if not generated)
+    table_literal = quoted_table.replace("'", "''")
+
+    with gzip.open(backup_file, 'wt', encoding='utf-8') as f:
+        for sequence, _ in serial_sequences:
+            f.write(f"CREATE SEQUENCE IF NOT EXISTS {sequence};\n")
+        column_sql = ",\n    ".join(column_defs)
+        f.write(f"CREATE TABLE {quoted_table} (\n    {column_sql}\n);\n")
+        for sequence, name in serial_sequences:
+            f.write(f"ALTER SEQUENCE {sequence} OWNED BY {quoted_table}.{quoted_columns[name]};\n")
+        f.write("\n")
+        f.write(f"COPY {quoted_table} ({column_list}) FROM stdin;\n")
+        cursor.copy_expert(f"COPY {quoted_table} ({column_list}) TO STDOUT", f)
+        f.write("\\.\n")
+        for name, last_value, is_called in sequence_values:
+            column_literal = name.replace("'", "''")
+            f.write(f"\nSELECT pg_catalog.setval(pg_get_serial_sequence('{table_literal}', '{column_literal}'), "
+                    f"{last_value}, {'true' if is_called else 'false'});\n")
+        for indexdef in indexes:
+            f.write(f"\n{indexdef};\n")
+
 def backup_tables(conn, tables, schema='public'):
-    """Create file backups of all affected tables before processing."""
+    """
+    Create file backups of all affected tables before processing.
+
+    Every table is copied over the existing connection inside one REPEATABLE READ
+    transaction, so the backups all come from the same snapshot.
+    """
     timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
     backup_dir = os.path.join(os.getcwd(), 'backups')
     backup_info = {}
@@ -295,64 +652,96 @@ def backup_tables(conn, tables, schema='public'):
         logger.error(f"Failed to create backup directory: {e}")
         return backup_info  # Continue without backups
 
-    for table in tables:
-        # Ensure table name is lowercase for consistency
-        table = table.lower()
-
-        if not check_table_exists(conn, table, schema):
-            logger.info(f"Table '{schema}.{table}' does not exist, no backup needed.")
-            continue
+    # Ensure table names are lowercase for consistency
+    tables = sorted({table.lower() for table in tables})
 
-        backup_file = os.path.join(backup_dir, f"{table}_backup_{timestamp}.sql")
+    # Start the snapshot transaction; nothing is pending before the backups
+    conn.rollback()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;")
 
-        try:
-            # Validate identifiers
-            try:
-                validated_schema = quote_identifier(schema)
-                validated_table = quote_identifier(table)
-            except ValueError as e:
-                logger.error(f"Invalid identifier in backup_tables: {e}")
-                continue  # Skip this table
+            # Look up which tables exist in a single round trip
+            cursor.execute("""
+                SELECT table_name
+                FROM information_schema.tables
+                WHERE table_schema = %s
+                AND table_name = ANY(%s);
+            """, (schema, tables))
+            present_tables = {row[0] for row in cursor.fetchall()}
 
-            # Construct the '--table' argument using validated identifiers
-            if any(char.isupper() or not char.isalnum() and char != '_' for char in schema + table):
-                table_arg = f'"{schema}"."{table}"'
-            else:
-                table_arg = f'{schema}.{table}'
-
-            # Prepare the pg_dump command
-            cmd = [
-                'pg_dump',
-                f'--host={conn.info.host}',
-                f'--port={conn.info.port}',
-                f'--username={conn.info.user}',
-                f'--dbname={conn.info.dbname}',
-                f'--table={table_arg}',
-                '--format=p',
-                f'--file={backup_file}'
-            ]
+            for table in tables:
+                if table not in present_tables:
+                    logger.info(f"Table '{schema}.{table}' does not exist, no backup needed.")
+                    continue
 
-            # Set PGPASSWORD environment variable for the subprocess
-            env = os.environ.copy()
-            env['PGPASSWORD'] = conn.info.password
+                # Validate identifiers
+                try:
+                    quote_identifier(schema)
+                    quote_identifier(table)
+                except ValueError as e:
+                    logger.error(f"Invalid identifier in backup_tables: {e}")
+                    continue  # Skip this table
 
-            # Execute pg_dump
-            subprocess.run(cmd, env=env, check=True, capture_output=True)
+                backup_file = os.path.join(backup_dir, f"{table}_backup_{timestamp}.sql.gz")
+                try:
+                    cursor.execute("SAVEPOINT backup_table")
+                    dump_table(cursor, schema, table, backup_file)
+                    cursor.execute("RELEASE SAVEPOINT backup_table")
+                except (psycopg2.Error, OSError, ValueError) as e:
+                    cursor.execute("ROLLBACK TO SAVEPOINT backup_table")
+                    logger.error(f"Failed to backup table '{schema}.{table}': {e}")
+                    continue  # Continue processing even if backup fails
+
+                backup_info[table] = backup_file
+                logger.info(f"Created backup of '{schema}.{table}' to '{backup_file}'")
+
+                # Manage old backups
+                manage_old_backups(backup_dir, table)  # Pass lowercase table name
+    finally:
+        # End the read-only snapshot before the load starts
+        conn.rollback()
 
-            backup_info[table] = backup_file
-            logger.info(f"Created backup of '{schema}.{table}' to '{backup_file}'")
+    return backup_info
 
-            # Manage old backups
-            manage_old_backups(backup_dir, table)  # Pass lowercase table name
+def choose_index_method(gdf, args):
+    """
+    Pick the spatial index access method for a table.
 
-        except subprocess.CalledProcessError as e:
-            logger.error(f"Failed to backup table '{schema}.{table}': {e.stderr.decode()}")
-            # Continue processing even if backup fails
+    SP-GiST is used when requested with --spgist, or when every geometry is a
+    (multi)point or (multi)linestring, or every geometry is polygonal; for those
+    it builds smaller and faster indexes than GiST. Mixed tables keep GiST.
+    """
+    if getattr(args, 'spgist', False):
+        return 'spgist'
+    geom_types = set(gdf.geom_type.dropna().unique())
+    if geom_types and any(geom_types <= family for family in SPGIST_GEOMETRY_FAMILIES):
+        return 'spgist'
+    return 'gist'
+
+def supports_spgist(conn):
+    """Check whether the PostGIS installation has SP-GiST operator classes (PostGIS 2.5+)."""
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SAVEPOINT postgis_version")
+            cursor.execute("SELECT postgis_lib_version();")
+            version = cursor.fetchone()[0]
+            cursor.execute("RELEASE SAVEPOINT postgis_version")
+    except psycopg2.Error as e:
+        with conn.cursor() as cursor:
+            cursor.execute("ROLLBACK TO SAVEPOINT postgis_version")
+        logger.debug(f"Could not determine the PostGIS version: {e}")
+        return False
+    major, minor = (int(part) for part in re.findall(r'\d+', version)[:2])
+    return (major, minor) >= (2, 5)
 
-    return backup_info
+def create_spatial_index(conn, table_name, schema='public', geom_column='geom', method='gist', fillfactor=None):
+    """
+    Create a spatial index on the geometry column using GiST or SP-GiST.
 
-def create_spatial_index(conn, table_name, schema='public', geom_column='geom'):
-    """Create a spatial index on the geometry column."""
+    Pass fillfactor=100 for freshly loaded tables that are not expected to grow;
+    packing the index pages fully makes it smaller and cheaper to scan.
+    """
     try:
         # Validate and quote identifiers
         quoted_schema = quote_identifier(schema)
@@ -363,11 +752,18 @@ def create_spatial_index(conn, table_name, schema='public', geom_column='geom'):
         safe_index_name = re.sub(r'[^a-zA-Z0-9_]', '_', f"{schema}_{table_name}_{geom_column}_idx")
         quoted_index_name = quote_identifier(safe_index_name)
         
+        if method == 'spgist' and not supports_spgist(conn):
+            logger.debug("PostGIS is older than 2.5 and has no SP-GiST support, building a GiST index")
+            method = 'gist'
+
+        # The index build memory comes from the session's maintenance_work_mem (--maintenance-work-mem)
         with conn.cursor() as cursor:
+            using = 'SPGIST' if method == 'spgist' else 'GIST'
+            storage = f" WITH (fillfactor = {int(fillfactor)})" if fillfactor else ""
             sql = f"""
                 CREATE INDEX IF NOT EXISTS {quoted_index_name}
                 ON {quoted_schema}.{quoted_table}
-                USING GIST ({quoted_geom});
+                USING {using} ({quoted_geom}){storage};
             """
             cursor.execute(sql)
             conn.commit()
@@ -376,6 +772,77 @@ def create_spatial_index(conn, table_name, schema='public', geom_column='geom'):
         logger.error(f"Error creating spatial index on '{schema}.{table_name}': {e}")
         conn.rollback()
 
+def has_spatial_index(conn, table_name, schema='public', geom_column='geom'):
+    """Check whether the geometry column is covered by a GiST or SP-GiST index."""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT EXISTS (
+                SELECT 1
+                FROM pg_index i
+                JOIN pg_class t ON t.oid = i.indrelid
+                JOIN pg_namespace n ON n.oid = t.relnamespace
+                JOIN pg_class ic ON ic.oid = i.indexrelid
+                JOIN pg_am am ON am.oid = ic.relam
+                JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = ANY(i.indkey)
+                WHERE n.nspname = %s
+                AND t.relname = %s
+                AND a.attname = %s
+                AND am.amname IN ('gist', 'spgist')
+            );
+        """, (schema, table_name, geom_column))
+        exists = cursor.fetchone()[0]
+    return exists
+
+@contextmanager
+def suspend_indexes(conn, table_name, schema='public', geom_column='geom'):
+    """
+    Drop the spatial indexes on a geometry column and rebuild them on exit.
+
+    Building a GiST index once over the loaded rows is much cheaper than
+    maintaining it row by row during a large load.
+
+    Args:
+        conn: Database connection
+        table_name: Name of the table
+        schema: Database schema
+        geom_column: Name of the geometry column
+    """
+    quoted_schema = quote_identifier(schema)
+
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT ic.relname, pg_get_indexdef(i.indexrelid)
+            FROM pg_index i
+            JOIN pg_class t ON t.oid = i.indrelid
+            JOIN pg_namespace n ON n.oid = t.relnamespace
+            JOIN pg_class ic ON ic.oid = i.indexrelid
+            JOIN pg_am am ON am.oid = ic.relam
+            JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = ANY(i.indkey)
+            WHERE n.nspname = %s
+            AND t.relname = %s
+            AND a.attname = %s
+            AND am.amname IN ('gist', 'spgist')
+        """, (schema, table_name, geom_column))
+        indexes = cursor.fetchall()
+
+        for index_name, _ in indexes:
+            cursor.execute(f"DROP INDEX IF EXISTS {quoted_schema}.{quote_identifier(index_name)}")
+        logger.debug(f"Dropped {len(indexes)} spatial index(es) on '{schema}.{table_name}'")
+
+    try:
+        yield
+    finally:
+        try:
+            with conn.cursor() as cursor:
+                for _, definition in indexes:
+                    # The drop may have been rolled back with a failed load
+                    cursor.execute(definition.replace('CREATE INDEX ', 'CREATE INDEX IF NOT EXISTS ', 1))
+            conn.commit()
+            logger.debug(f"Rebuilt {len(indexes)} spatial index(es) on '{schema}.{table_name}'")
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"Error rebuilding spatial indexes on '{schema}.{table_name}': {e}")
+
 def get_db_geometry_column(conn, table_name, schema='public'):
     # Validate and quote identifiers
     try:
@@ -414,6 +881,33 @@ def get_db_geometry_column(conn, table_name, schema='public'):
         else:
             return None
 
+def get_geometry_metadata(conn, schema='public'):
+    """
+    Fetch the geometry column, SRID and geometry type of every table in a schema in one query.
+
+    Args:
+        conn: Database connection
+        schema: Database schema (default: 'public')
+
+    Returns:
+        Dict mapping table name to a (geometry column, srid, type) tuple for its
+        first geometry column; srid and type are None when PostGIS does not
+        register the column in geometry_columns
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT DISTINCT ON (c.table_name) c.table_name, c.column_name, g.srid, g.type
+            FROM information_schema.columns c
+            LEFT JOIN geometry_columns g
+              ON g.f_table_schema = c.table_schema
+             AND g.f_table_name = c.table_name
+             AND g.f_geometry_column = c.column_name
+            WHERE c.table_schema = %s
+            AND c.udt_name = 'geometry'
+            ORDER BY c.table_name, c.ordinal_position;
+        """, (schema,))
+        return {table_name: (column, srid, geom_type) for table_name, column, srid, geom_type in cursor.fetchall()}
+
 def check_table_exists(conn, table_name, schema='public'):
     with conn.cursor() as cursor:
         cursor.execute("""
@@ -427,8 +921,88 @@ def check_table_exists(conn, table_name, schema='public'):
     return exists
 
 def compute_geom_hash(geometry):
-    wkb = geometry.wkb
-    return hashlib.md5(wkb).hexdigest()
+    wkb = shapely.to_wkb(geometry, byte_order=1, flavor='iso')
+    return hashlib.md5(wkb).digest()
+
+def unique_geom_hashes(geometries):
+    """
+    Compute MD5 hashes for the distinct geometries in an array.
+
+    All geometries are serialized to WKB in a single vectorized GEOS call and
+    duplicate WKBs are collapsed before hashing, so repeated geometries are
+    hashed (and later probed) only once. The WKB is little-endian ISO WKB so the
+    hashes match MD5(ST_AsBinary(geom)) in PostGIS, including for geometries
+    with Z or M values. Hashes are the raw 16-byte digests.
+
+    Returns:
+        Tuple of (codes, hashes): codes is an integer array giving each input
+        geometry's position in hashes, or -1 for missing geometries
+    """
+    wkbs = shapely.to_wkb(geometries, byte_order=1, flavor='iso')
+    codes, unique_wkbs = pd.factorize(wkbs)
+    return codes, [hashlib.md5(wkb).digest() for wkb in unique_wkbs]
+
+def geom_hash_sql(geom_column):
+    """
+    SQL expression hashing a geometry column the way unique_geom_hashes does.
+
+    The geom_hash index is built on this expression and comparisons filter on
+    it, so both must come from here for the planner to match them.
+    """
+    return f"DECODE(MD5(ST_AsBinary({geom_column})), 'hex')"
+
+def ensure_geom_hash_index(conn, table_name, schema='public', geom_column='geom'):
+    """
+    Give a table a B-tree expression index on the hash of its geometries.
+
+    Comparisons then probe the index instead of hashing every stored row. The
+    index leaves the table's columns untouched; building it blocks writes to
+    the table, but not reads, until it finishes.
+
+    Args:
+        conn: Database connection
+        table_name: Name of the table
+        schema: Database schema
+        geom_column: Name of the geometry column
+
+    Returns:
+        bool: True if the table has the geom_hash index afterwards
+    """
+    quoted_schema = quote_identifier(schema)
+    quoted_table = quote_identifier(table_name)
+    quoted_geom = quote_identifier(geom_column)
+    quoted_index = quote_identifier(f"{table_name}_geom_hash_idx")
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (f"{quoted_schema}.{quoted_index}",))
+        if cursor.fetchone()[0]:
+            return True
+        logger.info(f"Indexing geometry hashes of '{schema}.{table_name}'; "
+                    f"writes to the table wait until this finishes")
+
+        cursor.execute("SAVEPOINT add_geom_hash")
+        try:
+            cursor.execute(f"""
+                CREATE INDEX IF NOT EXISTS {quoted_index}
+                ON {quoted_schema}.{quoted_table} (({geom_hash_sql(quoted_geom)}))
+            """)
+            cursor.execute("RELEASE SAVEPOINT add_geom_hash")
+        except psycopg2.Error as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT add_geom_hash")
+            logger.debug(f"Could not index geometry hashes of '{schema}.{table_name}', hashing on the fly: {e}")
+            return False
+
+    logger.debug(f"geom_hash index ready on '{schema}.{table_name}'")
+    return True
+
+def non_essential_column_pattern(custom_patterns: List[str] = None):
+    """Return the compiled exclusion pattern, folding any custom patterns into the default alternation."""
+    if not custom_patterns:
+        return NON_ESSENTIAL_COLUMN_PATTERN
+    return re.compile(
+        '|'.join(f'(?:{pattern})' for pattern in NON_ESSENTIAL_COLUMN_PATTERNS + tuple(custom_patterns)),
+        re.IGNORECASE
+    )
 
 def get_non_essential_columns(conn, table_name: str, schema: str = 'public', custom_patterns: List[str] = None) -> Set[str]:
     """
@@ -443,86 +1017,64 @@ def get_non_essential_columns(conn, table_name: str, schema: str = 'public', cus
     Returns:
         Set[str]: A set of column names to exclude.
     """
-    if custom_patterns is None:
-        custom_patterns = []
-        
-    all_columns = set()
-    pk_columns = set()
-    default_columns = set()
+    return get_non_essential_columns_bulk(conn, [table_name], schema, custom_patterns)[table_name]
+
+def get_non_essential_columns_bulk(conn, table_names: List[str], schema: str = 'public', custom_patterns: List[str] = None) -> dict:
+    """
+    Retrieve the non-essential columns of several tables in one round trip.
+
+    A column is non-essential if its name matches an exclusion pattern, or if
+    it is part of the primary key or has a default value.
+    
+    Args:
+        conn: Database connection object.
+        table_names (List[str]): Names of the tables.
+        schema (str): Schema of the tables (default is 'public').
+        custom_patterns (List[str], optional): Additional regex patterns for exclusion.
     
+    Returns:
+        dict: Table name mapped to the set of column names to exclude; tables
+        that do not exist map to an empty set.
+    """
+    exclude_columns = {table_name: set() for table_name in table_names}
+    exclusion_pattern = non_essential_column_pattern(custom_patterns)
+
     try:
         with conn.cursor() as cursor:
-            # Fetch all column names
-            cursor.execute("""
-                SELECT column_name
-                FROM information_schema.columns
-                WHERE table_schema = %s
-                AND table_name = %s
-            """, (schema, table_name))
-            all_columns = set(row[0] for row in cursor.fetchall())
-            
-            # Fetch primary key columns
-            cursor.execute("""
-                SELECT kcu.column_name
-                FROM information_schema.table_constraints tc
-                JOIN information_schema.key_column_usage kcu
-                  ON tc.constraint_name = kcu.constraint_name
-                 AND tc.table_schema = kcu.table_schema
-                WHERE tc.constraint_type = 'PRIMARY KEY'
-                  AND tc.table_schema = %s
-                  AND tc.table_name = %s
-            """, (schema, table_name))
-            pk_columns = set(row[0] for row in cursor.fetchall())
-            
-            # Fetch columns with default values
+            # Fetch all columns, flagging primary key columns and those with default
+            # values; the query text is constant, so the server can reuse its plan
             cursor.execute("""
-                SELECT column_name
-                FROM information_schema.columns
-                WHERE table_schema = %s
-                AND table_name = %s
-                AND column_default IS NOT NULL
-            """, (schema, table_name))
-            default_columns = set(row[0] for row in cursor.fetchall())
-            
+                SELECT c.table_name, c.column_name,
+                       c.column_default IS NOT NULL OR pk.column_name IS NOT NULL
+                FROM information_schema.columns c
+                LEFT JOIN (
+                    SELECT kcu.table_name, kcu.column_name
+                    FROM information_schema.table_constraints tc
+                    JOIN information_schema.key_column_usage kcu
+                      ON tc.constraint_name = kcu.constraint_name
+                     AND tc.table_schema = kcu.table_schema
+                     AND tc.table_name = kcu.table_name
+                    WHERE tc.constraint_type = 'PRIMARY KEY'
+                      AND tc.table_schema = %s
+                      AND tc.table_name = ANY(%s)
+                ) pk ON pk.table_name = c.table_name AND pk.column_name = c.column_name
+                WHERE c.table_schema = %s
+                AND c.table_name = ANY(%s)
+            """, (schema, list(table_names), schema, list(table_names)))
+            for table_name, column_name, is_metadata_excluded in cursor.fetchall():
+                if is_metadata_excluded or exclusion_pattern.match(column_name):
+                    exclude_columns[table_name].add(column_name)
+
     except Exception as e:
-        logger.error(f"Error getting non-essential columns for '{schema}.{table_name}': {e}")
-        return set()  # Return empty set on error
-    
-    # Define regex patterns for exclusion
-    exclusion_patterns = [
-        r'^id$',          # Exact match 'id'
-        r'^gid$',         # Exact match 'gid'
-        r'.*_id$',        # Suffix '_id'
-        r'.*_gid$',       # Suffix '_gid'
-        r'^uuid$',        # Exact match 'uuid'
-        r'^created_at$',  # Exact match 'created_at'
-        r'^updated_at$',  # Exact match 'updated_at'
-        r'^.*_at$',       # Suffix '_at'
-    ]
-    
-    # Add custom patterns if any
-    exclusion_patterns.extend(custom_patterns)
-    
-    # Compile regex patterns
-    compiled_patterns = [re.compile(pattern, re.IGNORECASE) for pattern in exclusion_patterns]
-    
-    # Identify columns matching exclusion patterns
-    pattern_excluded = set()
-    for col in all_columns:
-        if any(pattern.match(col) for pattern in compiled_patterns):
-            pattern_excluded.add(col)
-    
-    # Combine pattern-based exclusions with metadata-based exclusions
-    metadata_excluded = pk_columns.union(default_columns)
-    
-    # Final set of columns to exclude
-    exclude_columns = pattern_excluded.union(metadata_excluded)
-    
+        logger.error(f"Error getting non-essential columns in schema '{schema}': {e}")
+        return {table_name: set() for table_name in table_names}
+
     return exclude_columns
 
-def compare_geometries(gdf: GeoDataFrame, conn, table_name: str, geom_column: str = 'geom', schema: str = 'public', exclude_columns: List[str] = None, args=None):
-    # Get the actual geometry column name from the database
-    db_geom_column = get_db_geometry_column(conn, table_name, schema=schema)
+def compare_geometries(gdf: GeoDataFrame, conn, table_name: str, geom_column: str = 'geom', schema: str = 'public', exclude_columns: List[str] = None, args=None, db_geom_column: str = None):
+    # Get the actual geometry column name from the database unless the caller already knows it
+    if db_geom_column is None:
+        db_geom_column = get_db_geometry_column(conn, table_name, schema=schema)
     if not db_geom_column:
         logger.error(f"No geometry column found in table '{schema}.{table_name}'")
         return None, None, None
@@ -536,134 +1088,157 @@ def compare_geometries(gdf: GeoDataFrame, conn, table_name: str, geom_column: st
         logger.error(f"Invalid identifier in compare_geometries: {e}")
         return None, None, None
 
-    sql = f"""
-    SELECT MD5(ST_AsBinary({quoted_geom_col})) as geom_hash
-    FROM {quoted_schema}.{quoted_table}
-    """
-    
-    # Get existing geometry hashes from database
-    existing_hashes = set()
+    # Upload the incoming hashes once and let the server semi-join them against the
+    # table, so only the positions of identical rows come back over the wire
+    # The expression index lets the semi-join probe stored hashes; without it
+    # (for example without ownership of the table) every stored row is hashed
+    ensure_geom_hash_index(conn, table_name, schema, db_geom_column)
+    stored_hash = geom_hash_sql(f"t.{quoted_geom_col}")
+
+    # The hashes only partition the rows, so they are kept off the frame. Only
+    # distinct geometries are uploaded and probed; codes maps them back to rows
+    codes, hashes = unique_geom_hashes(gdf[geom_column].to_numpy())
     with conn.cursor() as cur:
-        cur.execute(sql)
-        for row in cur.fetchall():
-            existing_hashes.add(row[0])
-    
-    # Create temporary copy of GDF for comparison
-    comparison_gdf = gdf.copy()
-    comparison_gdf['geom_hash'] = comparison_gdf[geom_column].apply(compute_geom_hash)
-    
-    # Compare with database hashes
-    new_geometries = []
-    identical_geometries = []
-    
-    for idx, row in comparison_gdf.iterrows():
-        geom_hash = row['geom_hash']
-        if geom_hash in existing_hashes:
-            identical_geometries.append(row)
-        else:
-            new_geometries.append(row)
-    
-    # Convert lists to GeoDataFrames
-    new_gdf = GeoDataFrame(new_geometries, geometry=geom_column, crs=gdf.crs) if new_geometries else GeoDataFrame(columns=gdf.columns)
-    identical_gdf = GeoDataFrame(identical_geometries, geometry=geom_column, crs=gdf.crs) if identical_geometries else GeoDataFrame(columns=gdf.columns)
-    
-    # Remove temporary hash column
-    for gdf_temp in [new_gdf, identical_gdf]:
-        if 'geom_hash' in gdf_temp.columns:
-            gdf_temp.drop('geom_hash', axis=1, inplace=True)
+        cur.execute("CREATE TEMP TABLE incoming_hashes (idx INTEGER, geom_hash BYTEA)")
+        psycopg2.extras.execute_values(
+            cur, "INSERT INTO incoming_hashes (idx, geom_hash) VALUES %s", enumerate(hashes), page_size=10000
+        )
+
+    # Both sides compare raw 16-byte MD5 digests. The positions are streamed
+    # through a server-side cursor straight into the mask of distinct geometries
+    # (with a trailing False that rows without a geometry, code -1, pick up)
+    is_identical_unique = np.zeros(len(hashes) + 1, dtype=bool)
+    with conn.cursor(name='identical_hashes') as stream:
+        stream.itersize = 50000
+        stream.execute(f"""
+        SELECT i.idx
+        FROM incoming_hashes i
+        WHERE EXISTS (
+            SELECT 1 FROM {quoted_schema}.{quoted_table} t
+            WHERE {stored_hash} = i.geom_hash
+        )
+        """)
+        for (idx,) in stream:
+            is_identical_unique[idx] = True
+
+    with conn.cursor() as cur:
+        cur.execute("DROP TABLE incoming_hashes")
+
+    is_identical = is_identical_unique[codes]
+    new_gdf = gdf[~is_identical]
+    identical_gdf = gdf[is_identical]
     
     return new_gdf if not new_gdf.empty else None, None, identical_gdf if not identical_gdf.empty else None
 
-def update_geometries(gdf, table_name, engine, unique_id_column, schema='public'):
-    """Update existing geometries in PostGIS table."""
+def changed_column_condition(column, column_type):
+    """
+    Build the SQL condition that is true when a staged value differs from the stored one.
+
+    Geometries are compared by their EWKB, since the geometry = operator only
+    compares bounding boxes on older PostGIS releases, and json, which has no
+    equality operator, by its text.
+
+    Args:
+        column: Column name
+        column_type: SQL type of the column, as reported by format_type
+
+    Returns:
+        SQL condition comparing t.<column> with s.<column>
+    """
+    quoted = quote_identifier(column)
+    if column_type.lower().startswith('geometry'):
+        return f"ST_AsEWKB(t.{quoted}) IS DISTINCT FROM ST_AsEWKB(s.{quoted})"
+    if column_type.lower() == 'json':
+        return f"t.{quoted}::text IS DISTINCT FROM s.{quoted}::text"
+    return f"t.{quoted} IS DISTINCT FROM s.{quoted}"
+
+def update_geometries(conn, gdf, table_name, unique_id_column, schema='public'):
+    """
+    Update existing geometries in PostGIS table.
+
+    Rows are loaded with COPY into a temporary table typed like the target
+    columns and applied with a single UPDATE ... FROM, joined on the unique
+    id column. Only rows where at least one value changed are rewritten.
+
+    Returns:
+        bool: True if the updates were committed (or there was nothing to update)
+    """
     if gdf is None or gdf.empty:
-        return
+        return True
 
     try:
-        # Create temporary table for updates
-        temp_table = f"temp_{table_name}"
-        gdf.to_postgis(
-            name=temp_table,
-            con=engine,
-            schema=schema,
-            if_exists='replace',
-            index=False
-        )
+        quoted_schema = quote_identifier(schema)
+        quoted_table = quote_identifier(table_name)
+        quoted_id = quote_identifier(unique_id_column)
 
-        with engine.connect() as connection:
-            from sqlalchemy import text
-            
-            # Get existing columns using parameterized query
-            cursor = connection.execute(text("""
-                SELECT column_name 
-                FROM information_schema.columns 
-                WHERE table_schema = :schema AND table_name = :table_name
-            """), {"schema": schema, "table_name": table_name})
-            existing_columns = {row[0] for row in cursor}
-            
-            # Add any new columns to the main table
+        with conn.cursor() as cursor:
+            # Get existing columns and their types
+            cursor.execute("""
+                SELECT a.attname, format_type(a.atttypid, a.atttypmod)
+                FROM pg_attribute a
+                JOIN pg_class c ON c.oid = a.attrelid
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = %s
+                AND c.relname = %s
+                AND a.attnum > 0
+                AND NOT a.attisdropped
+            """, (schema, table_name))
+            column_types = dict(cursor.fetchall())
+
+            # Add any new columns to the main table in a single ALTER TABLE
+            add_clauses = []
             for col in gdf.columns:
-                if col not in existing_columns:
+                if col not in column_types:
                     # Determine column type from GeoDataFrame
-                    dtype = gdf[col].dtype
-                    sql_type = {
-                        'object': 'TEXT',
-                        'int64': 'INTEGER',
-                        'float64': 'DOUBLE PRECISION'
-                    }.get(str(dtype), 'TEXT')
-                    
-                    quoted_col = quote_identifier(col)
-                    quoted_table = quote_identifier(table_name)
-                    quoted_schema = quote_identifier(schema)
-                    
+                    sql_type = UPDATE_COLUMN_TYPES.get(str(gdf[col].dtype), 'TEXT')
                     logger.info(f"Adding new column '{col}' with type {sql_type}")
-                    connection.execute(text(f"""
-                        ALTER TABLE {quoted_schema}.{quoted_table} 
-                        ADD COLUMN IF NOT EXISTS {quoted_col} {sql_type}
-                    """))
-            
-            # Build update statement with proper quoting
-            quoted_schema = quote_identifier(schema)
-            quoted_table = quote_identifier(table_name)
-            quoted_temp = quote_identifier(temp_table)
-            quoted_id = quote_identifier(unique_id_column)
-            
-            update_cols = ", ".join([
-                f"{quote_identifier(col)} = s.{quote_identifier(col)}"
-                for col in gdf.columns if col != unique_id_column
-            ])
-            
-            sql = text(f"""
+                    add_clauses.append(f"ADD COLUMN IF NOT EXISTS {quote_identifier(col)} {sql_type}")
+                    column_types[col] = sql_type
+            if add_clauses:
+                cursor.execute(f"ALTER TABLE {quoted_schema}.{quoted_table} {', '.join(add_clauses)}")
+
+            # Stage the rows with COPY, typed like the target columns, then apply them in one UPDATE
+            staging_table = f"_upd_{table_name}"
+            quoted_staging = quote_identifier(staging_table)
+            staging_columns = ", ".join(f"{quote_identifier(col)} {column_types[col]}" for col in gdf.columns)
+            cursor.execute(f"DROP TABLE IF EXISTS pg_temp.{quoted_staging}")
+            cursor.execute(f"CREATE TEMP TABLE {quoted_staging} ({staging_columns})")
+
+            bulk_copy_geodataframe(conn, gdf, staging_table, schema='pg_temp')
+
+            update_columns = [col for col in gdf.columns if col != unique_id_column]
+            set_clause = ", ".join(
+                f"{quote_identifier(col)} = s.{quote_identifier(col)}" for col in update_columns
+            )
+            # Rows whose values all match are skipped, so they write no new tuple
+            # version and leave the spatial index alone
+            changed_clause = " OR ".join(
+                changed_column_condition(col, column_types[col]) for col in update_columns
+            )
+            cursor.execute(f"""
                 UPDATE {quoted_schema}.{quoted_table} t
-                SET {update_cols}
-                FROM {quoted_schema}.{quoted_temp} s
+                SET {set_clause}
+                FROM pg_temp.{quoted_staging} s
                 WHERE t.{quoted_id} = s.{quoted_id}
+                AND ({changed_clause})
             """)
-            
-            connection.execute(sql)
-            connection.execute(text(f'DROP TABLE IF EXISTS {quoted_schema}.{quoted_temp}'))
-            connection.commit()
-        
+            cursor.execute(f"DROP TABLE pg_temp.{quoted_staging}")
+            conn.commit()
+
         logger.info(f"Successfully updated {len(gdf)} geometries in {table_name}")
+        return True
     except Exception as e:
+        conn.rollback()
         logger.error(f"Error updating geometries: {e}")
-
-def check_geometry_type_constraint(conn, table_name, schema='public'):
-    with conn.cursor() as cursor:
-        cursor.execute("""
-            SELECT type 
-            FROM geometry_columns 
-            WHERE f_table_schema = %s 
-            AND f_table_name = %s
-        """, (schema, table_name))
-        result = cursor.fetchone()
-    
-    if result and result[0].upper() != 'GEOMETRY':
-        return result[0].upper()
-    return None
+        return False
 
 def create_generic_geometry_table(conn, engine, table_name, srid, schema='public'):
-    """Create a new table with a generic geometry column and specified SRID."""
+    """
+    Create a new table with a generic geometry column and specified SRID.
+
+    The spatial index is left to the caller so it can be built once the table is loaded,
+    and the geom_hash index is added by the first comparison against the table.
+    """
     try:
         quoted_schema = quote_identifier(schema)
         quoted_table = quote_identifier(table_name)
@@ -684,9 +1259,6 @@ def create_generic_geometry_table(conn, engine, table_name, srid, schema='public
             
             conn.commit()
         
-        # Add spatial index after commit
-        create_spatial_index(conn, table_name, schema=schema)
-        
         logger.info(f"Created new table '{schema}.{table_name}' with generic geometry type (SRID: {srid})")
         return True
     except Exception as e:
@@ -694,35 +1266,889 @@ def create_generic_geometry_table(conn, engine, table_name, srid, schema='public
         logger.error(f"Error creating table: {e}")
         return False
 
-def append_geometries(conn, engine, gdf, table_name, schema='public'):
-    """Append geometries using raw SQL to avoid CRS issues."""
+def to_hex_ewkb(gdf):
+    """
+    Serialize the active geometry column to hex-encoded EWKB in one vectorized call.
+
+    PostGIS parses hex EWKB text directly into geometry, SRID included, so the
+    result can be sent as a plain text column with COPY or bound parameters.
+
+    Args:
+        gdf: GeoDataFrame whose geometries to serialize
+
+    Returns:
+        Numpy array of hex EWKB strings (None for missing geometries)
+    """
+    srid = get_epsg(gdf.crs)
+    geoms = shapely.set_srid(gdf.geometry.to_numpy(), srid or 0)
+    return shapely.to_wkb(geoms, hex=True, include_srid=True)
+
+def copy_ready_column(values):
+    """
+    Prepare an attribute column for COPY CSV.
+
+    Integer fields with missing values are read as float64, which would be
+    written as 1.0 and rejected by INTEGER and BIGINT columns. Float columns
+    holding only whole numbers are therefore written through the nullable
+    Int64 dtype.
+    """
+    if not pd.api.types.is_float_dtype(values.dtype):
+        return values
+    present = values.dropna().to_numpy()
+    if (len(present) and np.isfinite(present).all() and (np.abs(present) < 2 ** 53).all()
+            and (present == np.floor(present)).all()):
+        return values.astype('Int64')
+    return values
+
+def bulk_copy_geodataframe(conn, gdf, table_name, schema='public', chunksize=100000, freeze=False):
+    """
+    Stream a GeoDataFrame into an existing table using COPY FROM STDIN.
+
+    Geometries are sent as hex-encoded EWKB, which PostGIS parses directly.
+    Missing values are written as COPY_NULL, so empty strings stay empty
+    strings. Rows are serialized and copied one chunk at a time so the CSV
+    buffer never holds more than chunksize rows.
+
+    Args:
+        conn: Database connection
+        gdf: GeoDataFrame to load
+        table_name: Name of the target table
+        schema: Database schema (default: 'public')
+        chunksize: Maximum number of rows per COPY
+        freeze: Load the rows already frozen, sparing the first VACUUM and hint-bit
+            writes; the table must have been created in the current (sub)transaction
+
+    Returns:
+        int: Number of rows copied
+    """
+    quoted_schema = quote_identifier(schema)
+    quoted_table = quote_identifier(table_name)
+    options = f"FORMAT csv, NULL '{COPY_NULL}'"
+    if freeze:
+        options += ", FREEZE"
+    copy_sql = psycopg2.sql.SQL(
+        f"COPY {quoted_schema}.{quoted_table} ({{}}) FROM STDIN WITH ({options})"
+    ).format(column_list(gdf.columns))
+
+    geom_column = gdf.geometry.name
+    # Decide per column once, so every chunk of a column is written the same way
+    attributes = pd.DataFrame({col: copy_ready_column(gdf[col]) for col in gdf.columns if col != geom_column})
+
+    copied = 0
+    with conn.cursor() as cursor:
+        for start in range(0, len(gdf), chunksize):
+            chunk = gdf.iloc[start:start + chunksize]
+            ewkb = to_hex_ewkb(chunk)
+
+            frame = pd.DataFrame({
+                col: (ewkb if col == geom_column else attributes[col].iloc[start:start + chunksize].array)
+                for col in chunk.columns
+            })
+            buffer = io.StringIO()
+            frame.to_csv(buffer, header=False, index=False, na_rep=COPY_NULL)
+            buffer.seek(0)
+
+            cursor.copy_expert(copy_sql, buffer)
+            copied += cursor.rowcount
+    return copied
+
+def create_table_from_geodataframe(conn, gdf, table_name, schema='public'):
+    """
+    Create a table matching the columns of a GeoDataFrame, replacing any existing one.
+
+    Column types are derived from the pandas dtypes. The geometry column is typed
+    with the frame's geometry type (or generic Geometry for mixed types) and SRID,
+    with Z only when every geometry has it. A mix of 2D and 3D geometries gets an
+    unconstrained geometry column, as no typmod accepts both.
+
+    Args:
+        conn: Database connection
+        gdf: GeoDataFrame whose layout the table should follow
+        table_name: Name of the table to create
+        schema: Database schema (default: 'public')
+    """
+    quoted_schema = quote_identifier(schema)
+    quoted_table = quote_identifier(table_name)
+
+    geom_column = gdf.geometry.name
+    srid = get_epsg(gdf.crs)
+    geom_types = gdf.geom_type.dropna().unique()
+    geom_type = geom_types[0] if len(geom_types) == 1 else 'Geometry'
+    geoms = gdf.geometry
+    has_z = geoms.has_z[~(geoms.isna() | geoms.is_empty)]
+    if len(has_z) and has_z.all():
+        geom_column_type = f"geometry({geom_type}Z, {srid or 0})"
+    elif has_z.any():
+        geom_column_type = "geometry"
+    else:
+        geom_column_type = f"geometry({geom_type}, {srid or 0})"
+
+    column_defs = []
+    for col in gdf.columns:
+        if col == geom_column:
+            sql_type = geom_column_type
+        else:
+            dtype = gdf[col].dtype
+            if pd.api.types.is_bool_dtype(dtype):
+                sql_type = 'BOOLEAN'
+            elif pd.api.types.is_integer_dtype(dtype):
+                sql_type = 'BIGINT'
+            elif pd.api.types.is_float_dtype(dtype):
+                sql_type = 'DOUBLE PRECISION'
+            elif isinstance(dtype, pd.DatetimeTZDtype):
+                # Keep the offset; TIMESTAMP would silently drop it
+                sql_type = 'TIMESTAMPTZ'
+            elif pd.api.types.is_datetime64_any_dtype(dtype):
+                sql_type = 'TIMESTAMP'
+            else:
+                sql_type = 'TEXT'
+        # Column names come from the file, so they are quoted without quote_identifier's checks
+        column_defs.append(psycopg2.sql.SQL(f"{{}} {sql_type}").format(psycopg2.sql.Identifier(col)))
+
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {quoted_schema}.{quoted_table}")
+        cursor.execute(psycopg2.sql.SQL(f"CREATE TABLE {quoted_schema}.{quoted_table} ({{}})").format(
+            psycopg2.sql.SQL(', ').join(column_defs)
+        ))
+
+def copy_insert_method(table, conn, keys, data_iter):
+    """
+    pandas to_sql insertion method that loads rows with COPY FROM STDIN.
+
+    Rows are written as plain CSV text, so geometries must already be
+    serialized (see to_hex_ewkb). Missing values are written as COPY_NULL.
+
+    Args:
+        table: pandas SQLTable being written
+        conn: SQLAlchemy connection
+        keys: Column names
+        data_iter: Iterable of row tuples
+
+    Returns:
+        Number of rows copied
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows(tuple(COPY_NULL if value is None else value for value in row) for row in data_iter)
+    buffer.seek(0)
+
+    quoted_table = quote_identifier(table.name)
+    if table.schema:
+        quoted_table = f"{quote_identifier(table.schema)}.{quoted_table}"
+    copy_sql = psycopg2.sql.SQL(
+        f"COPY {quoted_table} ({{}}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')"
+    ).format(column_list(keys))
+
+    with conn.connection.dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(copy_sql, buffer)
+        return cursor.rowcount
+
+def import_with_to_postgis(sa_conn, gdf, table_name, schema='public'):
+    """
+    Create and load a new table through geopandas and pandas.
+
+    to_postgis creates the empty table, with a generic geometry column. The rows
+    are then written by to_sql with their geometries as hex EWKB text, which
+    PostGIS parses on input: streamed with COPY first, and if that is not
+    possible (for example because of triggers or permissions), retried with
+    multi-row INSERT statements. Each attempt runs in its own savepoint so a
+    failure does not abort the shared transaction.
+
+    Args:
+        sa_conn: SQLAlchemy connection holding the shared transaction
+        gdf: GeoDataFrame to import
+        table_name: Name of the table to create
+        schema: Database schema (default: 'public')
+
+    Returns:
+        bool: True if the table was created and loaded
+    """
+    rows = pd.DataFrame(gdf).assign(**{gdf.geometry.name: to_hex_ewkb(gdf)})
+    for method, chunksize in ((copy_insert_method, 10000), ('multi', 5000)):
+        try:
+            with sa_conn.begin_nested():
+                gdf.iloc[:0].to_postgis(
+                    name=table_name,
+                    con=sa_conn,
+                    schema=schema,
+                    if_exists='replace',
+                    index=False
+                )
+                rows.to_sql(
+                    table_name,
+                    sa_conn,
+                    schema=schema,
+                    if_exists='append',
+                    index=False,
+                    chunksize=chunksize,
+                    method=method
+                )
+            # Both calls raise if the table was not written
+            return True
+        except Exception as e:
+            logger.debug(f"Import into '{schema}.{table_name}' with method {method} failed: {e}")
+    return False
+
+def combine_geodataframes(gdfs):
+    """Concatenate GeoDataFrames bound for the same table, aligning them to the first CRS."""
+    if len(gdfs) == 1:
+        return gdfs[0]
+
+    crs = gdfs[0].crs
+    geom_column = gdfs[0].geometry.name
+    aligned = [gdf if gdf.crs == crs else reproject_geodataframe(gdf, crs) for gdf in gdfs]
+    return GeoDataFrame(pd.concat(aligned, ignore_index=True), geometry=geom_column, crs=crs)
+
+def sort_by_hilbert(gdf):
+    """
+    Order rows along a Hilbert curve so spatially close geometries are written together.
+
+    Presorted rows give the spatial index tighter, less overlapping pages and
+    keep later range queries on fewer heap pages. Missing and empty geometries,
+    which have no position on the curve, are kept at the end.
+
+    Args:
+        gdf: GeoDataFrame to sort
+
+    Returns:
+        The GeoDataFrame in Hilbert order
+    """
+    geoms = gdf.geometry
+    located = ~(geoms.isna() | geoms.is_empty).to_numpy()
+    if located.sum() < 2:
+        return gdf
+
+    keys = np.full(len(gdf), np.iinfo(np.int64).max, dtype=np.int64)
+    keys[located] = geoms[located].hilbert_distance()
+    return gdf.iloc[np.argsort(keys, kind='stable')]
+
+def append_geometries(conn, gdf, table_name, schema='public'):
+    """
+    Append geometries to a table with COPY.
+
+    Rows are not checked against the table again: callers pass the rows
+    compare_geometries found to be new by their geometry hash, or load a table
+    they just created, so that hash is the only duplicate rule.
+
+    Returns:
+        int: Number of rows appended, or None if the append failed
+    """
     try:
-        # Create temporary table with schema (use quoted identifiers)
-        temp_table = f"temp_{table_name}"
-        gdf.to_postgis(
-            temp_table,
-            engine,
-            schema=schema,
-            if_exists='replace',
-            index=False
-        )
+        appended = bulk_copy_geodataframe(conn, gdf, table_name, schema)
+        conn.commit()
+        return appended
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error appending geometries: {e}")
+        return None
+
+def estimate_row_count(conn, table_name, schema='public'):
+    """Return the planner's row estimate for a table from pg_class.reltuples (-1 if never analyzed)."""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT c.reltuples
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = %s
+            AND c.relname = %s
+        """, (schema, table_name))
+        result = cursor.fetchone()
+    return result[0] if result else -1
+
+def append_new_geometries(conn, gdf, table_name, schema, geom_column, args):
+    """
+    Append new geometries to an existing table, keeping its spatial index in step.
+
+    Rows are written in Hilbert order (see sort_by_hilbert).
+
+    Batches of at least INDEX_REBUILD_THRESHOLD rows that also add at least
+    INDEX_REBUILD_FRACTION of the table's rows (or any batch with --rebuild-index)
+    are loaded with the spatial index dropped and rebuilt in one pass afterwards,
+    which is far cheaper than updating it row by row.
+
+    Returns:
+        int: Number of rows appended, or None if the append failed
+    """
+    if getattr(args, 'rebuild_index', False):
+        rebuild = True
+    elif len(gdf) >= INDEX_REBUILD_THRESHOLD:
+        # Rebuilding a large table's index costs more than maintaining it for a small share of new rows
+        rebuild = len(gdf) >= INDEX_REBUILD_FRACTION * estimate_row_count(conn, table_name, schema)
+    else:
+        rebuild = False
+
+    gdf = sort_by_hilbert(gdf)
+    if rebuild:
+        with suspend_indexes(conn, table_name, schema, geom_column):
+            return append_geometries(conn, gdf, table_name, schema)
+
+    if not has_spatial_index(conn, table_name, schema, geom_column):
+        create_spatial_index(conn, table_name, schema=schema, geom_column=geom_column,
+                             method=choose_index_method(gdf, args))
+    return append_geometries(conn, gdf, table_name, schema)
+
+def process_table_group(args, conn, engine, sa_conn, table_name, infos, existing_tables, schema,
+                        exclude_cols, geom_col_cache, pending_indexes, lock, read_pool=None):
+    """
+    Load every file that targets one table.
+
+    Args:
+        args: Command line arguments
+        conn: Database connection
+        engine: SQLAlchemy engine
+        sa_conn: SQLAlchemy connection holding the shared transaction for to_postgis writes
+        table_name: Name of the target table
+        infos: File info dicts for the files targeting this table
+        existing_tables: Set of existing tables, shared between workers
+        schema: Database schema
+        exclude_cols: Columns to exclude from comparison
+        geom_col_cache: Geometry column names per existing table
+        pending_indexes: (table, geometry column, index method) tuples whose spatial index is built after the load
+        lock: Lock guarding existing_tables and pending_indexes
+        read_pool: Worker processes reading the files (see file_read_pool), or None to read in threads
+
+    Returns:
+        Tuple of (new, updated, identical) geometry counts
+    """
+    total_new = 0
+    total_updated = 0
+    total_identical = 0
+    # Cleared when any write for this table fails, so its files are not marked as imported
+    committed = True
+    files = ", ".join(info['file'] for info in infos)
+    qualified_table = f"{schema}.{table_name}"
+
+    try:
+        logger.info(f"Processing [cyan]{files}[/]")
+
+        # Get existing geometry column name and handle renaming
+        existing_geom_col = geom_col_cache.get(table_name)
+        target_geom_col = 'geometry' if existing_geom_col == 'geometry' else 'geom'
+
+        # Files are only read now, so at most one table's data is held in memory
+        # (--table keeps only the geometry, so skip reading attribute columns altogether)
+        gdfs = []
+        for gdf in read_spatial_files(infos, args, columns=[] if args.table else None, pool=read_pool):
+            if gdf.geometry.name != target_geom_col:
+                logger.debug(f"Renaming geometry column from '{gdf.geometry.name}' to '{target_geom_col}'")
+                gdf = gdf.rename_geometry(target_geom_col)
+            gdfs.append(gdf)
+        if not gdfs:
+            return total_new, total_updated, total_identical
+        gdf = combine_geodataframes(gdfs)
+
+        if args.table:
+            # Handle --table option
+            gdf = gdf[[target_geom_col]]  # Keep only geometry column
+            
+            if table_name not in existing_tables:
+                srid = args.epsg if args.epsg else (get_epsg(gdf.crs) or 4326)
+                if create_generic_geometry_table(conn, engine, table_name, srid, schema):
+                    with lock:
+                        existing_tables.add(table_name)
+                else:
+                    return total_new, total_updated, total_identical
+
+                appended = append_geometries(conn, sort_by_hilbert(gdf), table_name, schema)
+                if appended is not None:
+                    # The table was empty, so build its index once after the load
+                    with lock:
+                        pending_indexes.append((table_name, 'geom', choose_index_method(gdf, args)))
+                    total_new += appended
+                    logger.info(f"Appended {format_number(appended)} [green]new[/] geometries to '{qualified_table}'")
+                else:
+                    committed = False
+            else:
+                new_geoms, updated_geoms, identical_geoms = compare_geometries(
+                    gdf, conn, table_name, target_geom_col, schema=schema, 
+                    exclude_columns=[], args=args, db_geom_column=existing_geom_col
+                )
+                
+                num_new = len(new_geoms) if new_geoms is not None else 0
+                num_identical = len(identical_geoms) if identical_geoms is not None else 0
+
+                logger.info(f"Found {format_number(num_new)} [green]new[/] geometries and "
+                          f"{format_number(num_identical)} [red]identical[/] geometries")
+                
+                if new_geoms is not None and not new_geoms.empty:
+                    appended = append_new_geometries(conn, new_geoms, table_name, schema, target_geom_col, args)
+                    if appended is not None:
+                        total_new += appended
+                        logger.info(f"Successfully appended {format_number(appended)} [green]new[/] geometries")
+                    else:
+                        committed = False
+                
+                if identical_geoms is not None:
+                    total_identical += num_identical
         
-        # Copy geometries from temp to main table (use quoted identifiers)
-        quoted_schema = quote_identifier(schema)
-        quoted_table = quote_identifier(table_name)
-        quoted_temp_table = quote_identifier(temp_table)
-        with conn.cursor() as cursor:
-            cursor.execute(f"""
-            INSERT INTO {quoted_schema}.{quoted_table} (geom)
-                SELECT geom FROM {quoted_schema}.{quoted_temp_table}
-            """)
-            cursor.execute(f"DROP TABLE IF EXISTS {quoted_schema}.{quoted_temp_table}")
+        elif table_name in existing_tables:
+            # Handle existing table without --table option
+            logger.info(f"Analyzing differences for existing table '[cyan]{qualified_table}[/]'")
+            
+            new_geoms, updated_geoms, identical_geoms = compare_geometries(
+                gdf, conn, table_name, target_geom_col, schema=schema,
+                exclude_columns=exclude_cols, args=args, db_geom_column=existing_geom_col
+            )
+
+            num_new = len(new_geoms) if new_geoms is not None else 0
+            num_updated = len(updated_geoms) if updated_geoms is not None else 0
+            num_identical = len(identical_geoms) if identical_geoms is not None else 0
+
+            logger.info(f"Found {format_number(num_new)} [green]new[/] geometries, "
+                      f"{format_number(num_updated)} [yellow]updated[/] geometries, and "
+                      f"{format_number(num_identical)} [red]identical[/] geometries")
+
+            if num_new > 0:
+                appended = append_new_geometries(conn, new_geoms, table_name, schema, target_geom_col, args)
+                if appended is not None:
+                    total_new += appended
+                    logger.info(f"Successfully appended {format_number(appended)} [green]new[/] geometries")
+                else:
+                    committed = False
+                    logger.error(f"[red]Error appending new geometries to '{qualified_table}'[/red]")
+
+            if num_updated > 0:
+                if update_geometries(conn, updated_geoms, table_name,
+                                     unique_id_column='osm_id', schema=schema):
+                    total_updated += num_updated
+                    logger.info(f"Successfully updated {format_number(num_updated)} [yellow]existing[/] geometries")
+                else:
+                    committed = False
+
+            total_identical += num_identical
+
+        else:
+            # Handle new table creation
+            logger.info(f"Creating new table '[cyan]{qualified_table}[/]'")
+            
+            if args.coordinates:
+                write_geometry_details(gdf, "NEW")
+
+            gdf = sort_by_hilbert(gdf)
+            try:
+                # Fast path: explicit CREATE TABLE plus COPY, guarded by a savepoint
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute("SAVEPOINT create_new_table")
+                    # The table is created inside this savepoint, so its rows can be loaded
+                    # frozen; with wal_level=minimal the COPY also skips WAL for the new table.
+                    # UNLOGGED plus SET LOGGED would rewrite the table through WAL afterwards
+                    # and leave the rewritten rows unfrozen
+                    create_table_from_geodataframe(conn, gdf, table_name, schema)
+                    bulk_copy_geodataframe(conn, gdf, table_name, schema, freeze=True)
+                    table_exists = True
+                except Exception as e:
+                    logger.debug(f"COPY import into '{qualified_table}' failed, falling back to to_postgis: {e}")
+                    with conn.cursor() as cursor:
+                        cursor.execute("ROLLBACK TO SAVEPOINT create_new_table")
+                    table_exists = False
+
+                if not table_exists:
+                    table_exists = import_with_to_postgis(sa_conn, gdf, table_name, schema)
+
+                if table_exists:
+                    # Commit the table on its own, so a failure in a later table group
+                    # cannot roll it back after it has been reported as imported
+                    conn.commit()
+                    # The index is built once the shared transaction commits
+                    with lock:
+                        pending_indexes.append((table_name, target_geom_col, choose_index_method(gdf, args)))
+                        existing_tables.add(table_name)
+                    total_new += len(gdf)
+                    logger.info(f"Successfully imported {format_number(len(gdf))} [green]new[/] geometries to '[cyan]{qualified_table}[/]'")
+                else:
+                    committed = False
+                    logger.error(f"[red]Failed to create table '{qualified_table}'[/red]")
+
+            except Exception as e:
+                committed = False
+                logger.error(f"[red]Error importing '{files}': {e}[/red]")
+
+        if committed and (total_new or total_updated or total_identical):
+            record_file_digests(conn, table_name, infos, schema)
             conn.commit()
-        return True
+
     except Exception as e:
+        logger.error(f"[red]Error processing '{files}': {e}[/red]")
+
+    return total_new, total_updated, total_identical
+
+def process_table_group_in_worker(args, engine, table_name, infos, existing_tables, schema,
+                                  exclude_cols, geom_col_cache, pending_indexes, lock):
+    """Run process_table_group on a pooled connection and commit its work."""
+    conn = engine.raw_connection()
+    try:
+        with engine.begin() as sa_conn:
+            result = process_table_group(
+                args, conn, engine, sa_conn, table_name, infos, existing_tables, schema,
+                exclude_cols, geom_col_cache, pending_indexes, lock
+            )
+        conn.commit()
+        return result
+    except Exception:
         conn.rollback()
-        logger.error(f"Error appending geometries: {e}")
-        return False
+        raise
+    finally:
+        conn.close()
+
+def read_spatial_file(full_path, file, args, columns=None, target_epsg=None):
+    """
+    Read a spatial file and bring it to the target CRS.
+
+    Args:
+        full_path: Path to the file
+        file: File name, used in log messages
+        args: Command line arguments
+        columns: Attribute columns to read, or None for all
+        target_epsg: EPSG code to reproject to, overriding args.epsg
+
+    Returns:
+        GeoDataFrame with its CRS set
+    """
+    gdf = pyogrio.read_dataframe(full_path, columns=columns, use_arrow=USE_ARROW)
+    source_crs = gdf.crs
+
+    # Handle CRS
+    epsg = target_epsg or args.epsg
+    if epsg:
+        source_epsg = get_epsg(source_crs)
+        if source_crs and source_epsg != epsg:
+            logger.info(f"[yellow]Reprojecting[/] from EPSG:{source_epsg} to EPSG:{epsg}")
+            gdf = reproject_geodataframe(gdf, epsg)
+        else:
+            gdf.set_crs(epsg=epsg, inplace=True)
+    elif not source_crs:
+        logger.warning(f"No CRS found in {file}, defaulting to [yellow]EPSG:4326[/]")
+        gdf.set_crs(epsg=4326, inplace=True)
+
+    return gdf
+
+def init_read_worker(log_queue, level):
+    """Send a read worker's log records to the parent process, which prints them above the progress bar."""
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    logger.setLevel(level)
+
+@contextmanager
+def file_read_pool(table_groups, args):
+    """
+    Start the worker processes that read the files of every table group, when they pay off.
+
+    Through Arrow, GDAL and the column conversion release the GIL, so threads
+    are enough. Without pyarrow, pyogrio builds the pandas columns while holding
+    the GIL, so tables made of several files are read in worker processes,
+    unless --jobs already spreads the tables over threads or the files add up
+    to less than PROCESS_READ_THRESHOLD bytes. Every worker imports the
+    libraries and every frame is pickled back, so one pool serves the whole run.
+    The processes are spawned rather than forked, as forking while other
+    threads run can deadlock.
+
+    Args:
+        table_groups: File info dicts per target table
+        args: Command line arguments
+
+    Yields:
+        ProcessPoolExecutor to pass to read_spatial_files, or None to read in threads
+    """
+    multi_file_groups = [infos for infos in table_groups.values() if len(infos) > 1]
+    if USE_ARROW or args.jobs > 1 or not multi_file_groups:
+        yield None
+        return
+    size = sum(
+        os.path.getsize(path)
+        for infos in multi_file_groups for info in infos
+        for path in spatial_file_paths(info['full_path'])
+    )
+    if size < PROCESS_READ_THRESHOLD:
+        yield None
+        return
+
+    context = multiprocessing.get_context('spawn')
+    log_queue = context.Queue()
+    listener = logging.handlers.QueueListener(log_queue, *logging.getLogger().handlers, respect_handler_level=True)
+    listener.start()
+    max_workers = min(max(len(infos) for infos in multi_file_groups), os.cpu_count() or 1)
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=init_read_worker,
+                                 initargs=(log_queue, logger.getEffectiveLevel())) as pool:
+            yield pool
+    finally:
+        listener.stop()
+
+def read_spatial_files(infos, args, columns=None, pool=None):
+    """
+    Read several spatial files concurrently.
+
+    Files are read in threads, or in the worker processes of pool when one is
+    given (see file_read_pool).
+
+    Args:
+        infos: File info dicts with 'file' and 'full_path' keys
+        args: Command line arguments
+        columns: Attribute columns to read, or None for all
+        pool: ProcessPoolExecutor from file_read_pool, or None to read in threads
+
+    Returns:
+        List of GeoDataFrames in the order of infos, skipping files that failed to read
+    """
+    gdfs = []
+    if pool is None or len(infos) == 1:
+        executor = ThreadPoolExecutor(max_workers=min(len(infos), os.cpu_count() or 1))
+    else:
+        executor = pool
+    # Workers only need the target EPSG; this keeps the password out of the worker processes
+    read_args = argparse.Namespace(epsg=args.epsg)
+    try:
+        futures = [
+            executor.submit(read_spatial_file, info['full_path'], info['file'], read_args, columns,
+                            info.get('target_epsg'))
+            for info in infos
+        ]
+        # Collect in listing order so results stay deterministic
+        for info, future in zip(infos, futures):
+            try:
+                gdfs.append(future.result())
+            except Exception as e:
+                logger.error(f"[red]Error reading '{info['file']}': {e}[/red]")
+    finally:
+        # The shared pool is shut down by file_read_pool
+        if executor is not pool:
+            executor.shutdown()
+    return gdfs
+
+def spatial_file_paths(full_path):
+    """Return the paths a spatial file is stored in: the file itself and, for a shapefile, its sidecars."""
+    paths = [full_path]
+    stem, ext = os.path.splitext(full_path)
+    if ext.lower() == '.shp':
+        paths.extend(stem + sidecar for sidecar in SHAPEFILE_SIDECARS if os.path.exists(stem + sidecar))
+    return paths
+
+def compute_file_digest(full_path):
+    """
+    Compute a BLAKE2b digest of a file's contents, including shapefile sidecars.
+
+    Args:
+        full_path: Path to the file
+
+    Returns:
+        Hex digest string
+    """
+    digest = hashlib.blake2b()
+    for path in spatial_file_paths(full_path):
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def skip_unchanged_files(conn, table_groups, existing_tables, schema, force=False):
+    """
+    Drop files whose contents match their last import into an existing table.
+
+    Every file is hashed and the digest kept in its info dict, so it can be
+    recorded with record_file_digests once the file is loaded. The digest
+    table is optional: with force, or when it cannot be created or read (for
+    example without CREATE privilege on the schema), every file is kept and
+    no digests are recorded.
+
+    Args:
+        conn: Database connection
+        table_groups: Mapping of target table name to file info dicts
+        existing_tables: Set of existing table names
+        schema: Target schema name
+        force: Keep unchanged files as well
+
+    Returns:
+        The table groups with unchanged files removed
+    """
+    if force:
+        return table_groups
+
+    with conn.cursor() as cursor:
+        cursor.execute("SAVEPOINT import_log")
+        try:
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {quote_identifier(schema)}.{IMPORT_LOG_TABLE} (
+                    table_name TEXT NOT NULL,
+                    file_name TEXT NOT NULL,
+                    digest TEXT NOT NULL,
+                    imported_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    PRIMARY KEY (table_name, file_name)
+                );
+            """)
+            cursor.execute(f"""
+                SELECT table_name, file_name, digest
+                FROM {quote_identifier(schema)}.{IMPORT_LOG_TABLE}
+                WHERE table_name = ANY(%s);
+            """, (list(table_groups),))
+            stored_digests = {(table_name, file): digest for table_name, file, digest in cursor.fetchall()}
+            cursor.execute("RELEASE SAVEPOINT import_log")
+        except psycopg2.Error as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT import_log")
+            logger.warning(f"Could not use '{schema}.{IMPORT_LOG_TABLE}', importing every file: {e}")
+            return table_groups
+    # Commit the log table now so --jobs workers can write to it
+    conn.commit()
+
+    infos = [info for group in table_groups.values() for info in group]
+    with ThreadPoolExecutor(max_workers=min(len(infos), os.cpu_count() or 1)) as executor:
+        futures = [executor.submit(compute_file_digest, info['full_path']) for info in infos]
+        for info, future in zip(infos, futures):
+            try:
+                info['digest'] = future.result()
+            except OSError as e:
+                logger.debug(f"Could not hash '{info['file']}': {e}")
+
+    remaining = {}
+    for table_name, group in table_groups.items():
+        changed = []
+        for info in group:
+            if (table_name in existing_tables and info.get('digest')
+                    and stored_digests.get((table_name, info['file'])) == info['digest']):
+                logger.info(f"'{info['file']}' is unchanged since its last import, skipping")
+            else:
+                changed.append(info)
+        if changed:
+            remaining[table_name] = changed
+    return remaining
+
+def record_file_digests(conn, table_name, infos, schema):
+    """
+    Record the digests of files just loaded into a table.
+
+    Args:
+        conn: Database connection
+        table_name: Name of the target table
+        infos: File info dicts carrying a 'digest' key
+        schema: Target schema name
+    """
+    rows = [(table_name, info['file'], info['digest']) for info in infos if info.get('digest')]
+    if not rows:
+        return
+    with conn.cursor() as cursor:
+        cursor.execute("SAVEPOINT record_digests")
+        try:
+            psycopg2.extras.execute_values(cursor, f"""
+                INSERT INTO {quote_identifier(schema)}.{IMPORT_LOG_TABLE} (table_name, file_name, digest)
+                VALUES %s
+                ON CONFLICT (table_name, file_name)
+                DO UPDATE SET digest = EXCLUDED.digest, imported_at = now();
+            """, rows)
+            cursor.execute("RELEASE SAVEPOINT record_digests")
+        except psycopg2.Error as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT record_digests")
+            logger.warning(f"Could not record the digests of the files loaded into '{schema}.{table_name}': {e}")
+
+def plan_crs_reprojection(conn, table_groups, existing_tables, args, schema, table_srids=None):
+    """
+    Resolve CRS mismatches against existing tables before any file is loaded.
+
+    Mismatched tables are collected first and confirmed with a single prompt,
+    so the import loop itself never waits on user input.
+
+    Args:
+        conn: Database connection
+        table_groups: Mapping of target table name to file info dicts
+        existing_tables: Set of existing table names
+        args: Command line arguments
+        schema: Target schema name
+        table_srids: SRID per existing table, when already known; otherwise
+            they are queried from geometry_columns
+
+    Returns:
+        The table groups to import; files bound for a confirmed table carry a 'target_epsg'
+    """
+    targets = [table_name for table_name in table_groups if table_name in existing_tables]
+    if not targets:
+        return table_groups
+
+    if table_srids is None:
+        with conn.cursor() as cursor:
+            cursor.execute("""
+                SELECT f_table_name, srid
+                FROM geometry_columns
+                WHERE f_table_schema = %s AND f_table_name = ANY(%s) AND srid <> 0;
+            """, (schema, targets))
+            table_srids = dict(cursor.fetchall())
+    else:
+        table_srids = {table_name: table_srids[table_name] for table_name in targets
+                       if table_srids.get(table_name)}
+
+    mismatched = {}
+    for table_name, table_srid in table_srids.items():
+        for info in table_groups[table_name]:
+            if args.epsg:
+                source_epsg = args.epsg
+            elif info.get('crs'):
+                source_epsg = get_epsg(pyproj.CRS.from_user_input(info['crs']))
+            else:
+                source_epsg = 4326
+            if source_epsg != table_srid:
+                mismatched[table_name] = table_srid
+                break
+
+    if not mismatched:
+        return table_groups
+
+    for table_name, table_srid in mismatched.items():
+        logger.warning(f"CRS mismatch: '{schema}.{table_name}' uses EPSG:{table_srid}")
+
+    if args.overwrite:
+        action = 'y'
+    else:
+        action = console.input(
+            f"Reproject new data to the existing CRS for {len(mismatched)} table(s)? (y/n): ")
+
+    if action.lower() != 'y':
+        for table_name in mismatched:
+            logger.info(f"Skipping '{schema}.{table_name}' due to CRS mismatch")
+        return {table_name: infos for table_name, infos in table_groups.items()
+                if table_name not in mismatched}
+
+    for table_name, table_srid in mismatched.items():
+        for info in table_groups[table_name]:
+            info['target_epsg'] = table_srid
+    return table_groups
+
+def create_spatial_index_in_worker(engine, table_name, schema, geom_column, method):
+    """Run create_spatial_index for a freshly loaded table on a pooled connection."""
+    conn = engine.raw_connection()
+    try:
+        create_spatial_index(conn, table_name, schema=schema, geom_column=geom_column,
+                             method=method, fillfactor=100)
+    finally:
+        conn.close()
+
+def build_spatial_indexes(engine, conn, pending_indexes, schema, max_workers=4):
+    """
+    Build the deferred spatial indexes, several tables at a time.
+
+    A single index build cannot be parallelized, but builds on different tables
+    can run side by side, each on a connection from the engine's pool. The tables
+    were just loaded, so their indexes are built fully packed.
+
+    Args:
+        engine: SQLAlchemy engine whose pool supplies the worker connections
+        conn: Database connection, used when there is only one index to build
+        pending_indexes: (table, geometry column, index method) tuples
+        schema: Database schema
+        max_workers: Maximum number of concurrent index builds
+    """
+    if not pending_indexes:
+        return
+    if len(pending_indexes) == 1:
+        table_name, geom_column, method = pending_indexes[0]
+        create_spatial_index(conn, table_name, schema=schema, geom_column=geom_column,
+                             method=method, fillfactor=100)
+        return
+
+    with ThreadPoolExecutor(max_workers=min(len(pending_indexes), max_workers)) as executor:
+        futures = [
+            executor.submit(create_spatial_index_in_worker, engine, table_name, schema, geom_column, method)
+            for table_name, geom_column, method in pending_indexes
+        ]
+        for future in futures:
+            future.result()
 
 def process_files(args, conn, engine, existing_tables, schema):
     """
@@ -732,7 +2158,7 @@ def process_files(args, conn, engine, existing_tables, schema):
         args: Command line arguments
         conn: Database connection
         engine: SQLAlchemy engine
-        existing_tables: List of existing tables
+        existing_tables: Set of existing tables
         schema: Database schema
     """
     logger.debug("Entering process_files...")
@@ -744,43 +2170,34 @@ def process_files(args, conn, engine, existing_tables, schema):
         # Start fresh transaction
         conn.rollback()  # Ensure clean state
         
-        # Determine file extensions to process
-        supported_extensions = ['.shp', '.geojson', '.json', '.gpkg', '.kml', '.gml']
         file_info_list = []
 
-        # List files only in the specified directory
-        for file in os.listdir(args.filepath):
-            if any(file.lower().endswith(ext) for ext in supported_extensions):
-                full_path = os.path.join(args.filepath, file)
-                if not os.path.isfile(full_path):
-                    continue
+        # List files only in the specified directory; scandir entries carry the
+        # file type, so only matching names cost an extra stat at most
+        with os.scandir(args.filepath) as entries:
+            spatial_files = [
+                entry for entry in entries
+                if SUPPORTED_FILE_PATTERN.search(entry.name) and entry.is_file()
+            ]
 
-                table_name = os.path.splitext(file)[0].lower()
-                try:
-                    gdf = gpd.read_file(full_path)
-                    source_crs = gdf.crs
-                    
-                    # Handle CRS
-                    if args.epsg:
-                        if source_crs and source_crs.to_epsg() != args.epsg:
-                            logger.info(f"[yellow]Reprojecting[/] from EPSG:{source_crs.to_epsg()} to EPSG:{args.epsg}")
-                            gdf.set_crs(source_crs, inplace=True)
-                            gdf = gdf.to_crs(epsg=args.epsg)
-                        else:
-                            gdf.set_crs(epsg=args.epsg, inplace=True)
-                    elif not source_crs:
-                        logger.warning(f"No CRS found in {file}, defaulting to [yellow]EPSG:4326[/]")
-                        gdf.set_crs(epsg=4326, inplace=True)
-
-                    file_info_list.append({
-                        'file': file,
-                        'full_path': full_path,
-                        'table_name': table_name,
-                        'gdf': gdf
-                    })
-                except Exception as e:
-                    logger.error(f"[red]Error reading '{file}': {e}[/red]")
-                    continue
+        for entry in spatial_files:
+            file = entry.name
+            full_path = entry.path
+
+            # Only inspect the layer metadata here; rows are read when the table is loaded
+            try:
+                layer_info = pyogrio.read_info(full_path)
+            except Exception as e:
+                logger.error(f"[red]Error reading '{file}': {e}[/red]")
+                continue
+
+            file_info_list.append({
+                'file': file,
+                'full_path': full_path,
+                'table_name': os.path.splitext(file)[0].lower(),
+                'fields': tuple(sorted(layer_info['fields'])),
+                'crs': layer_info['crs']
+            })
 
         if not file_info_list:
             logger.warning("[red]No spatial files found to process.[/red]")
@@ -789,30 +2206,55 @@ def process_files(args, conn, engine, existing_tables, schema):
         # Normalize table name if provided
         if args.table:
             args.table = args.table.lower()
+        elif args.union:
+            assign_union_tables(file_info_list)
 
         # Identify affected tables and create backups
         affected_tables = identify_affected_tables(file_info_list, args, schema)
         if not args.no_backup:
             backup_tables(conn, affected_tables, schema)
 
-        # Define columns to exclude from comparison
-        exclude_cols = set()
-        for info in file_info_list:
-            table_name = info['table_name']
-            non_essential = get_non_essential_columns(conn, table_name, schema=schema)
-            exclude_cols.update(non_essential)
-        exclude_cols = list(exclude_cols)
+        # Geometry column, SRID and type of all tables in the schema, fetched in one round trip
+        geometry_metadata = get_geometry_metadata(conn, schema)
+        geom_col_cache = {table_name: column for table_name, (column, _, _) in geometry_metadata.items()}
+
+        # Define columns to exclude from comparison, looked up for all tables at once
+        non_essential_columns = get_non_essential_columns_bulk(
+            conn, sorted({info['table_name'] for info in file_info_list}), schema=schema
+        )
+        exclude_cols = list(set().union(*non_essential_columns.values()))
 
         # Check geometry type constraint for --table option
         if args.table and args.table in existing_tables:
-            geom_type = check_geometry_type_constraint(conn, args.table, schema)
-            if geom_type:
+            _, _, geom_type = geometry_metadata.get(args.table, (None, None, None))
+            if geom_type and geom_type.upper() != 'GEOMETRY':
+                geom_type = geom_type.upper()
                 logger.error(f"[red]Error: Table '{schema}.{args.table}' has a specific {geom_type} geometry type constraint.[/red]")
                 logger.error("[yellow]To use this table with mixed geometry types, you need to either:[/yellow]")
                 logger.error("  1. Drop the existing table and let dbfriend create it with a generic geometry type")
                 logger.error("  2. Use a different table name")
                 sys.exit(1)
 
+        # New tables whose spatial index is built after the load
+        pending_indexes = []
+
+        # Group files by destination table so each table is loaded in one batch
+        table_groups = defaultdict(list)
+        for info in file_info_list:
+            table_groups[args.table if args.table else info['table_name']].append(info)
+
+        # Leave out files that have not changed since they were last imported
+        table_groups = skip_unchanged_files(conn, table_groups, existing_tables, schema, force=args.force)
+        if not table_groups:
+            logger.info("All files are unchanged since their last import")
+            return
+
+        # Settle CRS mismatches up front so the import loop never prompts
+        table_groups = plan_crs_reprojection(
+            conn, table_groups, existing_tables, args, schema,
+            table_srids={table_name: srid for table_name, (_, srid, _) in geometry_metadata.items()}
+        )
+
         # Initialize progress bar
         with Progress(
             SpinnerColumn(),
@@ -823,167 +2265,54 @@ def process_files(args, conn, engine, existing_tables, schema):
             console=console,
             expand=False
         ) as progress:
-            task = progress.add_task("       Processing files", total=len(file_info_list))
-
-            for info in file_info_list:
-                file = info['file']
-                table_name = args.table if args.table else info['table_name']
-                qualified_table = f"{schema}.{table_name}"
-                gdf = info['gdf']
-
-                try:
-                    logger.info(f"Processing [cyan]{file}[/]")
-
-                    # Get existing geometry column name and handle renaming
-                    existing_geom_col = get_db_geometry_column(conn, table_name, schema=schema)
-                    target_geom_col = 'geometry' if existing_geom_col == 'geometry' else 'geom'
-                    
-                    if gdf.geometry.name != target_geom_col:
-                        logger.debug(f"Renaming geometry column from '{gdf.geometry.name}' to '{target_geom_col}'")
-                        gdf = gdf.rename_geometry(target_geom_col)
-                        gdf.set_geometry(target_geom_col, inplace=True)
-                        gdf.set_crs(gdf.crs, inplace=True)
-
-                    if args.table:
-                        # Handle --table option
-                        gdf = gdf[[target_geom_col]]  # Keep only geometry column
-                        
-                        if table_name not in existing_tables:
-                            srid = args.epsg if args.epsg else (gdf.crs.to_epsg() or 4326)
-                            if create_generic_geometry_table(conn, engine, table_name, srid, schema):
-                                existing_tables.append(table_name)
-                            else:
-                                continue
-
-                            if append_geometries(conn, engine, gdf, table_name, schema):
-                                total_new += len(gdf)
-                                logger.info(f"Appended {format(len(gdf), ',').replace(',', ' ')} [green]new[/] geometries to '{qualified_table}'")
-                        else:
-                            new_geoms, updated_geoms, identical_geoms = compare_geometries(
-                                gdf, conn, table_name, target_geom_col, schema=schema, 
-                                exclude_columns=[], args=args
-                            )
-                            
-                            num_new = len(new_geoms) if new_geoms is not None else 0
-                            num_identical = len(identical_geoms) if identical_geoms is not None else 0
-
-                            logger.info(f"Found {format(num_new, ',').replace(',', ' ')} [green]new[/] geometries and "
-                                      f"{format(num_identical, ',').replace(',', ' ')} [red]identical[/] geometries")
-                            
-                            if new_geoms is not None and not new_geoms.empty:
-                                new_geoms.to_postgis(
-                                    name=table_name,
-                                    con=engine,
-                                    schema=schema,
-                                    if_exists='append',
-                                    index=False
-                                )
-                                total_new += num_new
-                                logger.info(f"Successfully appended {format(num_new, ',').replace(',', ' ')} [green]new[/] geometries")
-                            
-                            if identical_geoms is not None:
-                                total_identical += num_identical
-                    
-                    elif table_name in existing_tables:
-                        # Handle existing table without --table option
-                        logger.info(f"Analyzing differences for existing table '[cyan]{qualified_table}[/]'")
-                        
-                        new_geoms, updated_geoms, identical_geoms = compare_geometries(
-                            gdf, conn, table_name, target_geom_col, schema=schema,
-                            exclude_columns=exclude_cols, args=args
+            task = progress.add_task("       Processing files",
+                                     total=sum(len(infos) for infos in table_groups.values()))
+
+            lock = threading.Lock()
+            jobs = min(args.jobs, len(table_groups))
+
+            if jobs > 1:
+                # Each worker loads whole tables on its own connection and commits its own transaction
+                with ThreadPoolExecutor(max_workers=jobs) as executor:
+                    futures = {
+                        executor.submit(
+                            process_table_group_in_worker, args, engine, table_name, infos,
+                            existing_tables, schema, exclude_cols, geom_col_cache,
+                            pending_indexes, lock
+                        ): infos
+                        for table_name, infos in table_groups.items()
+                    }
+                    for future in as_completed(futures):
+                        num_new, num_updated, num_identical = future.result()
+                        total_new += num_new
+                        total_updated += num_updated
+                        total_identical += num_identical
+                        progress.advance(task, len(futures[future]))
+            else:
+                # Share one SQLAlchemy transaction across all to_postgis writes
+                with engine.begin() as sa_conn, file_read_pool(table_groups, args) as read_pool:
+                    for table_name, infos in table_groups.items():
+                        num_new, num_updated, num_identical = process_table_group(
+                            args, conn, engine, sa_conn, table_name, infos, existing_tables, schema,
+                            exclude_cols, geom_col_cache, pending_indexes, lock, read_pool
                         )
-
-                        num_new = len(new_geoms) if new_geoms is not None else 0
-                        num_updated = len(updated_geoms) if updated_geoms is not None else 0
-                        num_identical = len(identical_geoms) if identical_geoms is not None else 0
-
-                        logger.info(f"Found {format(num_new, ',').replace(',', ' ')} [green]new[/] geometries, "
-                                  f"{format(num_updated, ',').replace(',', ' ')} [yellow]updated[/] geometries, and "
-                                  f"{format(num_identical, ',').replace(',', ' ')} [red]identical[/] geometries")
-
-                        if num_new > 0:
-                            try:
-                                new_geoms.to_postgis(
-                                    name=table_name,
-                                    con=engine,
-                                    schema=schema,
-                                    if_exists='append',
-                                    index=False
-                                )
-                                total_new += num_new
-                                logger.info(f"Successfully appended {format(num_new, ',').replace(',', ' ')} [green]new[/] geometries")
-                            except Exception as e:
-                                logger.error(f"[red]Error appending new geometries: {e}[/red]")
-
-                        if num_updated > 0:
-                            update_geometries(updated_geoms, table_name, engine, 
-                                           unique_id_column='osm_id', schema=schema)
-                            total_updated += num_updated
-                            logger.info(f"Successfully updated {format(num_updated, ',').replace(',', ' ')} [yellow]existing[/] geometries")
-
+                        total_new += num_new
+                        total_updated += num_updated
                         total_identical += num_identical
-
-                    else:
-                        # Handle new table creation
-                        logger.info(f"Creating new table '[cyan]{qualified_table}[/]'")
-                        
-                        if args.coordinates:
-                            for _, row in gdf.iterrows():
-                                print_geometry_details(row, "NEW", args.coordinates)
-
-                        try:
-                            with conn.cursor() as cursor:
-                                # Safely create new table using parameterized query
-                                quoted_schema = quote_identifier(schema)
-                                quoted_table = quote_identifier(table_name)
-                                quoted_geom = quote_identifier(target_geom_col)
-                                
-                                gdf.to_postgis(
-                                    name=table_name,
-                                    con=engine,
-                                    schema=schema,
-                                    if_exists='replace',
-                                    index=False
-                                )
-
-                                # Verify table creation
-                                cursor.execute("""
-                                    SELECT EXISTS (
-                                        SELECT 1
-                                        FROM information_schema.tables
-                                        WHERE table_schema = %s
-                                        AND table_name = %s
-                                    );
-                                """, (schema, table_name))
-                                
-                                if cursor.fetchone()[0]:
-                                    create_spatial_index(conn, table_name, schema=schema, 
-                                                      geom_column=target_geom_col)
-                                    existing_tables.append(table_name)
-                                    total_new += len(gdf)
-                                    logger.info(f"Successfully imported {format(len(gdf), ',').replace(',', ' ')} [green]new[/] geometries to '[cyan]{qualified_table}[/]'")
-                                else:
-                                    logger.error(f"[red]Failed to create table '{qualified_table}'[/red]")
-
-                        except Exception as e:
-                            logger.error(f"[red]Error importing '{file}': {e}[/red]")
-                            continue
-
-                except Exception as e:
-                    logger.error(f"[red]Error processing '{file}': {e}[/red]")
-                    continue
-
-                progress.advance(task)
+                        progress.advance(task, len(infos))
 
         # Commit all changes
         conn.commit()
         logger.info("[green]All changes committed successfully[/green]")
+
+        # Build spatial indexes for the new tables now that their data is committed
+        build_spatial_indexes(engine, conn, pending_indexes, schema)
         
         # Print final summary with rich formatting
         logger.info("\n[bold]Summary of operations:[/bold]\n"
-                   f"• {format(total_new, ',').replace(',', ' ')} [green]new[/] geometries added\n"
-                   f"• {format(total_updated, ',').replace(',', ' ')} [yellow]updated[/] geometries\n"
-                   f"• {format(total_identical, ',').replace(',', ' ')} [red]identical[/] geometries skipped")
+                   f"• {format_number(total_new)} [green]new[/] geometries added\n"
+                   f"• {format_number(total_updated)} [yellow]updated[/] geometries\n"
+                   f"• {format_number(total_identical)} [red]identical[/] geometries skipped")
 
     except Exception as e:
         conn.rollback()
@@ -992,7 +2321,7 @@ def process_files(args, conn, engine, existing_tables, schema):
 
     return total_new, total_updated, total_identical
 
-def check_crs_compatibility(gdf, conn, table_name, geom_column, args, schema='public'):
+def check_crs_compatibility(gdf, conn, table_name, geom_column, args, schema='public', existing_tables=None):
     """
     Check CRS compatibility between new data and existing table.
     
@@ -1003,39 +2332,55 @@ def check_crs_compatibility(gdf, conn, table_name, geom_column, args, schema='pu
         geom_column: Name of the geometry column
         args: Command line arguments
         schema: Database schema (default: 'public')
+        existing_tables: Set of existing tables; when given, table existence is
+            checked against it instead of querying the database
         
     Returns:
         GeoDataFrame or None: Returns the (possibly reprojected) GeoDataFrame or None if skipped
     """
+    if existing_tables is not None and table_name not in existing_tables:
+        logger.debug(f"Table '{schema}.{table_name}' does not exist, proceeding without CRS check")
+        return gdf
+
     try:
         with conn.cursor() as cursor:
-            # Check if the table exists using parameterized query
+            if existing_tables is None:
+                # Check if the table exists using parameterized query
+                cursor.execute("""
+                    SELECT EXISTS (
+                        SELECT 1
+                        FROM information_schema.tables 
+                        WHERE table_schema = %s AND table_name = %s
+                    );
+                """, (schema, table_name))
+                table_exists = cursor.fetchone()[0]
+
+                if not table_exists:
+                    logger.debug(f"Table '{schema}.{table_name}' does not exist, proceeding without CRS check")
+                    return gdf
+
+            # The SRID constraint is catalog metadata, so no table rows need to be read
             cursor.execute("""
-                SELECT EXISTS (
-                    SELECT 1
-                    FROM information_schema.tables 
-                    WHERE table_schema = %s AND table_name = %s
-                );
-            """, (schema, table_name))
-            table_exists = cursor.fetchone()[0]
+                SELECT srid
+                FROM geometry_columns
+                WHERE f_table_schema = %s AND f_table_name = %s AND f_geometry_column = %s;
+            """, (schema, table_name, geom_column))
+            result = cursor.fetchone()
 
-            if not table_exists:
-                logger.debug(f"Table '{schema}.{table_name}' does not exist, proceeding without CRS check")
-                return gdf
+            if not result or not result[0]:
+                # Columns without an SRID constraint report 0; sample a stored geometry instead
+                quoted_schema = quote_identifier(schema)
+                quoted_table = quote_identifier(table_name)
+                quoted_geom = quote_identifier(geom_column)
+
+                cursor.execute(f"""
+                    SELECT ST_SRID({quoted_geom})
+                    FROM {quoted_schema}.{quoted_table}
+                    WHERE {quoted_geom} IS NOT NULL
+                    LIMIT %s;
+                """, (1,))
+                result = cursor.fetchone()
 
-            # Get existing SRID using quoted identifiers for table/column names
-            quoted_schema = quote_identifier(schema)
-            quoted_table = quote_identifier(table_name)
-            quoted_geom = quote_identifier(geom_column)
-            
-            cursor.execute(f"""
-                SELECT ST_SRID({quoted_geom}) 
-                FROM {quoted_schema}.{quoted_table} 
-                WHERE {quoted_geom} IS NOT NULL 
-                LIMIT %s;
-            """, (1,))
-            result = cursor.fetchone()
-            
             if result:
                 existing_srid = result[0]
                 logger.info(f"Existing SRID for '{schema}.{table_name}' is {existing_srid}")
@@ -1044,7 +2389,7 @@ def check_crs_compatibility(gdf, conn, table_name, geom_column, args, schema='pu
                 return gdf
 
         # Rest of the function remains the same as it doesn't involve SQL
-        new_srid = gdf.crs.to_epsg() if gdf.crs else None
+        new_srid = get_epsg(gdf.crs)
         
         if new_srid is None:
             logger.warning(f"No EPSG code found for the CRS of the new data for '{schema}.{table_name}'")
@@ -1071,7 +2416,7 @@ def check_crs_compatibility(gdf, conn, table_name, geom_column, args, schema='pu
             
             if action.lower() == 'y':
                 try:
-                    gdf = gdf.to_crs(epsg=existing_srid)
+                    gdf = reproject_geodataframe(gdf, existing_srid)
                     logger.info(f"Reprojected new data to SRID {existing_srid}")
                 except Exception as e:
                     logger.error(f"Error reprojecting data for '{schema}.{table_name}': {e}")
@@ -1091,13 +2436,14 @@ def check_crs_compatibility(gdf, conn, table_name, geom_column, args, schema='pu
 def check_schema_exists(conn, schema_name: str) -> bool:
     """Check if the specified schema exists."""
     with conn.cursor() as cursor:
-        # Debug: List all available schemas
-        cursor.execute("""
-            SELECT schema_name 
-            FROM information_schema.schemata;
-        """)
-        all_schemas = [row[0] for row in cursor.fetchall()]
-        logger.debug(f"Available schemas: {all_schemas}")
+        # Debug: List all available schemas (skip the round-trip unless it will be logged)
+        if logger.isEnabledFor(logging.DEBUG):
+            cursor.execute("""
+                SELECT schema_name 
+                FROM information_schema.schemata;
+            """)
+            all_schemas = [row[0] for row in cursor.fetchall()]
+            logger.debug(f"Available schemas: {all_schemas}")
         
         # Check for specific schema
         cursor.execute("""
@@ -1163,20 +2509,29 @@ def main():
             if not check_schema_exists(conn, args.schema):
                 logger.error(f"[red]Schema '{args.schema}' does not exist. Please create it first.[/red]")
                 sys.exit(1)
+            # check_schema_exists has already pointed search_path at the schema
             logger.info(f"Using schema '{args.schema}'")
-            
-            logger.debug("Setting search_path...")
-            with conn.cursor() as cursor:
-                cursor.execute("SET search_path TO %s, public;", (args.schema,))
             schema = args.schema
         else:
             schema = 'public'
 
+        # Session-level settings so they survive the rollbacks in process_files
+        configure_bulk_session(conn, args.maintenance_work_mem)
+
+        # SQLAlchemy is only needed once connected; importing it here keeps it
+        # (a fifth of the module's import time) off --help and argument errors
+        from sqlalchemy import create_engine
+
         # Create SQLAlchemy engine with specific isolation level
         logger.debug("Creating SQLAlchemy engine...")
         engine = create_engine(
             f'postgresql://{args.dbuser}:{args.password}@{args.host}:{args.port}/{args.dbname}',
-            isolation_level='READ COMMITTED'  # Changed from AUTOCOMMIT
+            isolation_level='READ COMMITTED',  # Changed from AUTOCOMMIT
+            # Each --jobs worker holds a raw connection plus one for to_postgis
+            pool_size=max(4, 2 * args.jobs),
+            pool_pre_ping=True,
+            connect_args={'options': '-c synchronous_commit=off -c work_mem=256MB '
+                                     f'-c maintenance_work_mem={args.maintenance_work_mem}'}
         )
 
         # Switch to transaction mode for the main operations
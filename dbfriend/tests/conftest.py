@@ -0,0 +1,132 @@
+import os
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+import pytest
+from functools import lru_cache
+from unittest.mock import MagicMock
+from dotenv import load_dotenv
+from geopandas import GeoDataFrame, GeoSeries
+from shapely.geometry import Point
+
+
+@pytest.fixture
+def mock_logger(mocker):
+    """Silence the module logger; tests that assert on log calls take it as a parameter."""
+    return mocker.patch('dbfriend.dbfriend.logger')
+
+
+@pytest.fixture
+def db_mocks():
+    """
+    Connection and cursor mocks, wired the way the module opens cursors (with conn.cursor() as cursor).
+
+    Both are specced on the psycopg2 classes, so touching an attribute the
+    real connection or cursor does not have fails the test.
+    """
+    conn = MagicMock(spec=psycopg2.extensions.connection)
+    cursor = MagicMock(spec=psycopg2.extensions.cursor)
+    conn.cursor.return_value.__enter__.return_value = cursor
+    yield conn, cursor
+
+
+@pytest.fixture
+def patched_io(mocker):
+    """
+    Patch the directory listing and file reads process_files goes through.
+
+    The listing yields one regular file, test.shp, whose layer has no
+    attribute fields and whose single point reads in EPSG:4326. Returns the
+    entry and the mock for pyogrio.read_dataframe.
+    """
+    entry = MagicMock(path='test/path/test.shp')
+    entry.name = 'test.shp'
+    entry.is_file.return_value = True
+    mocker.patch('os.scandir').return_value.__enter__.return_value = iter([entry])
+    mocker.patch('dbfriend.dbfriend.pyogrio.read_info', return_value={'fields': [], 'crs': 'EPSG:4326'})
+    read_dataframe = mocker.patch(
+        'dbfriend.dbfriend.pyogrio.read_dataframe',
+        return_value=GeoDataFrame({'geometry': GeoSeries([Point(1, 1)])}, crs='EPSG:4326'),
+    )
+    return entry, read_dataframe
+
+
+@pytest.fixture(scope="session")
+def gdf_4326():
+    """One-point GeoDataFrame in EPSG:4326; tests take a .copy() before changing it."""
+    return GeoDataFrame({'geometry': GeoSeries([Point(1, 2)])}, crs='EPSG:4326')
+
+
+@pytest.fixture(scope="session")
+def gdf_3857():
+    """One-point GeoDataFrame in EPSG:3857; tests take a .copy() before changing it."""
+    return GeoDataFrame({'geometry': GeoSeries([Point(1, 2)])}, crs='EPSG:3857')
+
+
+@lru_cache(maxsize=None)
+def _test_db_settings():
+    """
+    Connection settings for the live test database, or None when it is not configured.
+
+    The .env file is parsed and the TEST_DB_* variables are read once per process.
+    """
+    load_dotenv()
+    env = {name: os.getenv(name) for name in (
+        'TEST_DB_NAME', 'TEST_DB_USER', 'TEST_DB_PASS', 'TEST_DB_HOST', 'TEST_DB_PORT')}
+    if not all(env[name] for name in ('TEST_DB_NAME', 'TEST_DB_USER', 'TEST_DB_PASS')):
+        return None
+    return {
+        'dbname': env['TEST_DB_NAME'],
+        'user': env['TEST_DB_USER'],
+        'password': env['TEST_DB_PASS'],
+        'host': env['TEST_DB_HOST'] or 'localhost',
+        'port': env['TEST_DB_PORT'] or '5432',
+    }
+
+
+def pytest_collection_modifyitems(config, items):
+    """Mark integration tests as skipped at collection when no test database is configured."""
+    if _test_db_settings() is not None:
+        return
+    skip = pytest.mark.skip(reason="Test database credentials not configured")
+    for item in items:
+        if 'integration' in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def test_db_settings():
+    """Connection settings for the live test database, or None when it is not configured."""
+    return _test_db_settings()
+
+
+@pytest.fixture(scope="session")
+def pg_pool(test_db_settings):
+    """Thread-safe connection pool on the test database, opened once for the whole session."""
+    if test_db_settings is None:
+        pytest.skip("Test database credentials not configured")
+    pool = psycopg2.pool.ThreadedConnectionPool(1, 8, **test_db_settings)
+    yield pool
+    pool.closeall()
+
+
+@pytest.fixture(scope="session")
+def postgis_ready(pg_pool):
+    """Enable the PostGIS extension once per session."""
+    conn = pg_pool.getconn()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS postgis;")
+        conn.commit()
+    finally:
+        pg_pool.putconn(conn)
+
+
+@pytest.fixture
+def pg_conn(pg_pool, postgis_ready):
+    """A pooled connection; whatever the test left uncommitted is rolled back before it is returned."""
+    conn = pg_pool.getconn()
+    yield conn
+    conn.rollback()
+    pg_pool.putconn(conn)
@@ -1,36 +1,101 @@
+import argparse
+import io
 import pytest
-from pandas.testing import assert_frame_equal
-from unittest.mock import MagicMock, patch, mock_open, call, ANY
+from unittest.mock import MagicMock, patch, call, ANY
 from dbfriend.dbfriend import (
     compute_geom_hash,
+    format_number,
+    reproject_geodataframe,
+    get_epsg,
+    epsg_of,
+    transformer_for,
+    unique_geom_hashes,
     get_non_essential_columns,
+    get_non_essential_columns_bulk,
     parse_arguments,
     check_schema_exists,
     get_db_geometry_column,
+    get_geometry_metadata,
     check_table_exists,
+    has_spatial_index,
+    choose_index_method,
+    create_spatial_index,
+    build_spatial_indexes,
+    suspend_indexes,
     print_geometry_details,
+    write_geometry_details,
     connect_db,
+    configure_bulk_session,
+    memory_setting,
     check_crs_compatibility,
     get_existing_tables,
     append_geometries,
+    append_new_geometries,
+    sort_by_hilbert,
+    estimate_row_count,
+    INDEX_REBUILD_THRESHOLD,
+    bulk_copy_geodataframe,
+    to_hex_ewkb,
+    copy_insert_method,
+    import_with_to_postgis,
+    plan_crs_reprojection,
+    compute_file_digest,
+    skip_unchanged_files,
+    record_file_digests,
+    backup_tables,
+    dump_table,
+    manage_old_backups,
+    update_geometries,
     create_generic_geometry_table,
+    ensure_geom_hash_index,
+    create_table_from_geodataframe,
     compare_geometries,
+    read_spatial_file,
+    read_spatial_files,
+    file_read_pool,
+    assign_union_tables,
+    SUPPORTED_FILE_PATTERN,
+    process_table_group,
     process_files
 )
+import gzip
+import logging
+import threading
 import hashlib
+import numpy as np
+import shapely
+from concurrent.futures import ProcessPoolExecutor
 from geopandas import GeoDataFrame, GeoSeries
-from geopandas.testing import assert_geodataframe_equal
-from shapely.geometry import Point, LineString, Polygon
+from shapely.geometry import Point, LineString, Polygon, MultiPoint, MultiLineString, MultiPolygon
+from pyproj import CRS
 import psycopg2
+import psycopg2.sql
 import sys
-from sqlalchemy import create_engine
 import os
 import pandas as pd
-from dotenv import load_dotenv
 
-load_dotenv()
+# Every test in this module runs with the module logger patched out
+pytestmark = pytest.mark.usefixtures("mock_logger")
+
+def prime_cursor(cursor, *, fetchone=None, fetchall=None):
+    """Queue the rows a cursor mock returns from successive fetchone()/fetchall() calls."""
+    if fetchone is not None:
+        cursor.fetchone.side_effect = fetchone
+    if fetchall is not None:
+        cursor.fetchall.side_effect = fetchall
+
+def render_sql(statement):
+    """Render a psycopg2.sql composable as text without a connection; plain strings pass through."""
+    if isinstance(statement, psycopg2.sql.Composed):
+        return ''.join(render_sql(part) for part in statement.seq)
+    if isinstance(statement, psycopg2.sql.Identifier):
+        return '.'.join('"' + part.replace('"', '""') + '"' for part in statement.strings)
+    if isinstance(statement, psycopg2.sql.SQL):
+        return statement.string
+    return statement
 
 def normalize_sql(sql):
+    sql = render_sql(sql)
     # Remove newlines and extra spaces
     sql = ' '.join(sql.split())
     # Remove spaces before semicolons and parentheses
@@ -39,31 +104,123 @@ def normalize_sql(sql):
     sql = sql.replace('( ', '(')
     return sql
 
+def executed_sql(cursor):
+    """The normalized SQL of every execute() call made on a cursor mock, in order."""
+    return [normalize_sql(c.args[0]) for c in cursor.execute.call_args_list]
+
+def assert_executed(cursor, expected_normalized):
+    """Assert a cursor mock executed exactly these (normalized) statements, in order."""
+    assert executed_sql(cursor) == expected_normalized
+
+# Expected queries, normalized once at import
+_EXPECTED_SCHEMA_LIST_SQL = normalize_sql("""
+    SELECT schema_name
+    FROM information_schema.schemata;
+""")
+_EXPECTED_SCHEMA_EXISTS_SQL = normalize_sql("""
+    SELECT EXISTS(
+        SELECT 1
+        FROM information_schema.schemata
+        WHERE schema_name = %s
+    );
+""")
+_EXPECTED_TABLE_EXISTS_SQL = normalize_sql("""
+    SELECT EXISTS (
+        SELECT 1
+        FROM information_schema.tables
+        WHERE table_schema = %s AND table_name = %s
+    );
+""")
+_EXPECTED_GEOM_COL_SQL = normalize_sql("""
+    SELECT f_geometry_column
+    FROM geometry_columns
+    WHERE f_table_schema = %s AND f_table_name = %s;
+""")
+_EXPECTED_EXISTING_TABLES_SQL = normalize_sql("""
+    SELECT table_name
+    FROM information_schema.tables
+    WHERE table_schema = %s;
+""")
+
+# CRS objects resolved once, so building test frames skips the PROJ database lookup
+_CRS_4326 = CRS.from_epsg(4326)
+_CRS_3857 = CRS.from_epsg(3857)
+
+# Shapely geometries are immutable, so tests share these instead of rebuilding them
+_P00 = Point(0, 0)
+_P11 = Point(1, 1)
+_P22 = Point(2, 2)
+_P12 = Point(1.0, 2.0)
+
+# A geometry and the MD5 digest of its little-endian WKB (0101000000 000000000000f03f 0000000000000040)
+_EXPECTED_POINT = _P12
+_EXPECTED_HASH = bytes.fromhex('4ddc678d472071b63dd260ae7d7cd0eb')
+
 # 1. Testing compute_geom_hash
 def test_compute_geom_hash():
-    # Create a mock geometry with known WKB
-    point = Point(1.0, 2.0)
-    expected_hash = hashlib.md5(point.wkb).hexdigest()
-    
-    # Call the function
-    result = compute_geom_hash(point)
-    
-    # Assert the hash matches the expected value
-    assert result == expected_hash
+    assert compute_geom_hash(_EXPECTED_POINT) == _EXPECTED_HASH
+
+def test_unique_geom_hashes_uses_iso_wkb_for_z():
+    # MD5 of the little-endian ISO WKB of POINT Z (1 2 3), as ST_AsBinary writes it
+    codes, hashes = unique_geom_hashes([Point(1.0, 2.0, 3.0)])
+
+    assert list(codes) == [0]
+    assert hashes == [bytes.fromhex('75f68cb5c4e3e7f6c8e8163e3660b55d')]
+
+def test_unique_geom_hashes_collapses_duplicates():
+    geoms = [_P12, None, _P12, Point(3.0, 4.0)]
+
+    codes, hashes = unique_geom_hashes(geoms)
+
+    assert list(codes) == [0, -1, 0, 1]
+    assert hashes == [compute_geom_hash(geoms[0]), compute_geom_hash(geoms[3])]
+
+def test_format_number():
+    assert format_number(0) == '0'
+    assert format_number(1234567) == '1 234 567'
+
+def test_get_epsg_caches_lookup():
+    crs = GeoDataFrame(geometry=[_P00], crs=_CRS_3857).crs
+
+    assert get_epsg(None) is None
+    assert get_epsg(crs) == 3857
+    hits = epsg_of.cache_info().hits
+    assert get_epsg(crs) == 3857
+    assert epsg_of.cache_info().hits == hits + 1
+
+def test_reproject_geodataframe_matches_to_crs():
+    gdf = GeoDataFrame(
+        {'name': ['a', 'b']},
+        geometry=[Point(10, 60, 5), LineString([(10, 60), (11, 61)])],
+        crs=_CRS_4326
+    ).rename_geometry('geom')
+
+    result = reproject_geodataframe(gdf, 3857)
+
+    assert result.crs.to_epsg() == 3857
+    assert result.geometry.name == 'geom'
+    assert result.geometry.geom_equals_exact(gdf.to_crs(epsg=3857).geometry, tolerance=1e-6).all()
+    assert result.geometry.iloc[0].z == 5
+
+def test_reproject_geodataframe_reuses_transformer():
+    gdf = GeoDataFrame(geometry=[Point(10, 60)], crs=_CRS_4326)
+
+    reproject_geodataframe(gdf, 25833)
+    hits = transformer_for.cache_info().hits
+    reproject_geodataframe(gdf.copy(), 25833)
+
+    assert transformer_for.cache_info().hits == hits + 1
 
 # 2. Testing get_non_essential_columns
-def test_get_non_essential_columns(mocker):
-    # Mock the database connection and cursor
-    mock_conn = MagicMock()
-    mock_cursor = MagicMock()
-    mock_conn.cursor.return_value = mock_cursor
-
-    # Define what cursor.fetchall() should return for each execute call
-    # First execute: all columns
-    mock_cursor.fetchall.side_effect = [
-        [('id',), ('name',), ('created_at',), ('geom',)],
-        [('id',)],
-        [('id',), ('created_at',)]
+def test_get_non_essential_columns(db_mocks, mocker):
+    mock_conn, mock_cursor = db_mocks
+
+    # One query returns every column, flagged if it is a primary key or has a default
+    mock_cursor.fetchall.return_value = [
+        ('test_table', 'id', True),
+        ('test_table', 'name', False),
+        ('test_table', 'created_at', True),
+        ('test_table', 'geom', False)
     ]
     
     # Call the function
@@ -75,461 +232,749 @@ def test_get_non_essential_columns(mocker):
     # Assert the excluded columns match
     assert exclude_columns == expected_exclude
 
-    # Assert the correct SQL queries were executed
-    assert mock_cursor.execute.call_count == 3
+    # Assert a single parameterized query was executed
+    mock_cursor.execute.assert_called_once()
+    assert mock_cursor.execute.call_args[0][1] == ('public', ['test_table'], 'public', ['test_table'])
 
-# 3. Testing parse_arguments
-def test_parse_arguments_help(mocker):
-    # Simulate passing --help
-    mocker.patch('sys.argv', ['dbfriend', '--help'])
+def test_get_non_essential_columns_custom_patterns(db_mocks):
+    mock_conn, mock_cursor = db_mocks
+    mock_cursor.fetchall.return_value = [
+        ('roads', 'ID', False), ('roads', 'road_id', False), ('roads', 'name', False),
+        ('roads', 'tmp_note', False), ('roads', 'geom', False)
+    ]
 
-    with pytest.raises(SystemExit) as pytest_wrapped_e:
-        parse_arguments()
-    
-    # Assert that the system exited with code 0
-    assert pytest_wrapped_e.type == SystemExit
-    assert pytest_wrapped_e.value.code == 0
+    exclude_columns = get_non_essential_columns(mock_conn, 'roads', custom_patterns=[r'^tmp_'])
 
-def test_parse_arguments_defaults(mocker):
-    # Simulate passing only required positional arguments
-    mocker.patch('sys.argv', ['dbfriend', 'user', 'dbname', '/path/to/files'])
+    assert exclude_columns == {'ID', 'road_id', 'tmp_note'}
 
-    args = parse_arguments()
+def test_get_non_essential_columns_bulk(db_mocks):
+    mock_conn, mock_cursor = db_mocks
+    mock_cursor.fetchall.return_value = [
+        ('roads', 'name', False), ('roads', 'road_id', False), ('roads', 'lanes', True),
+        ('parks', 'name', True), ('parks', 'gid', False)
+    ]
 
-    # Assert default values
-    assert args.dbuser == 'user'
-    assert args.dbname == 'dbname'
-    assert args.filepath == '/path/to/files'
-    assert not args.overwrite
-    assert args.log_level == 'INFO'
-    assert args.host == 'localhost'
-    assert args.port == '5432'
-    assert args.epsg is None
-    assert args.schema is None
-    assert not args.coordinates
-
-def test_parse_arguments_with_options(mocker):
-    # Simulate passing various options
-    mocker.patch('sys.argv', [
-        'dbfriend', 'user', 'dbname', '/path/to/files',
-        '--overwrite', '--log-level', 'DEBUG', '--host', '127.0.0.1',
-        '--port', '5433', '--epsg', '3857', '--schema', 'public',
-        '--coordinates'
-    ])
+    exclude_columns = get_non_essential_columns_bulk(mock_conn, ['roads', 'parks', 'lakes'])
+
+    assert exclude_columns == {'roads': {'road_id', 'lanes'}, 'parks': {'gid', 'name'}, 'lakes': set()}
+    mock_cursor.execute.assert_called_once()
+    assert mock_cursor.execute.call_args[0][1] == (
+        'public', ['roads', 'parks', 'lakes'], 'public', ['roads', 'parks', 'lakes']
+    )
+
+# 3. Testing parse_arguments
+@pytest.mark.parametrize("argv, expected", [
+    # --help exits cleanly
+    (['dbfriend', '--help'], SystemExit),
+    # Only the required positional arguments: everything else keeps its default
+    (['dbfriend', 'user', 'dbname', '/path/to/files'], {
+        'dbuser': 'user', 'dbname': 'dbname', 'filepath': '/path/to/files',
+        'overwrite': False, 'log_level': 'INFO', 'host': 'localhost', 'port': '5432',
+        'epsg': None, 'schema': None, 'coordinates': False, 'rebuild_index': False,
+        'maintenance_work_mem': '1GB',
+    }),
+    (['dbfriend', 'user', 'dbname', '/path/to/files',
+      '--overwrite', '--log-level', 'DEBUG', '--host', '127.0.0.1',
+      '--port', '5433', '--epsg', '3857', '--schema', 'public',
+      '--coordinates'], {
+        'overwrite': True, 'log_level': 'DEBUG', 'host': '127.0.0.1', 'port': '5433',
+        'epsg': 3857, 'schema': 'public', 'coordinates': True,
+    }),
+])
+def test_parse_arguments(mocker, argv, expected):
+    mocker.patch('sys.argv', argv)
+
+    if expected is SystemExit:
+        with pytest.raises(SystemExit) as pytest_wrapped_e:
+            parse_arguments()
+        assert pytest_wrapped_e.value.code == 0
+        return
 
     args = parse_arguments()
 
-    # Assert values are set correctly
-    assert args.overwrite
-    assert args.log_level == 'DEBUG'
-    assert args.host == '127.0.0.1'
-    assert args.port == '5433'
-    assert args.epsg == 3857
-    assert args.schema == 'public'
-    assert args.coordinates
+    assert {name: getattr(args, name) for name in expected} == expected
 
 # 4. Testing check_schema_exists
-def test_check_schema_exists_exists(mocker):
-    # Mock the database connection and cursor
-    mock_conn = MagicMock()
-    mock_cursor = MagicMock()
-    mock_conn.cursor.return_value = mock_cursor
-
-    # Mock fetchall() to return a list of existing schemas
+@pytest.mark.parametrize("fetchone, debug, expected, expected_calls", [
+    # With debug logging the available schemas are listed before the check,
+    # and an existing schema is put on the search_path
+    ((True,), True, True,
+     [_EXPECTED_SCHEMA_LIST_SQL, _EXPECTED_SCHEMA_EXISTS_SQL, 'SET search_path TO "public", public;']),
+    # Without debug logging the schema listing query is skipped
+    ((False,), False, False, [_EXPECTED_SCHEMA_EXISTS_SQL]),
+])
+def test_check_schema_exists(db_mocks, mock_logger, fetchone, debug, expected, expected_calls):
+    mock_conn, mock_cursor = db_mocks
+    mock_logger.isEnabledFor.return_value = debug
     mock_cursor.fetchall.return_value = [('public',), ('schema2',)]
+    mock_cursor.fetchone.return_value = fetchone
 
-    # Mock fetchone() to simulate that the schema exists
-    mock_cursor.fetchone.return_value = (True,)
+    assert check_schema_exists(mock_conn, 'public') is expected
 
-    # Call the function
-    exists = check_schema_exists(mock_conn, 'public')
+    assert_executed(mock_cursor, expected_calls)
 
-    # Assert
-    assert exists is True
+# 5. Testing get_db_geometry_column
+@pytest.mark.parametrize("fetchone, expected", [
+    # Registered in geometry_columns
+    ([('geom',)], 'geom'),
+    # Not in geometry_columns; found through information_schema
+    ([None, ('geometry',)], 'geometry'),
+    # No geometry column at all
+    ([None, None], None),
+])
+def test_get_db_geometry_column(db_mocks, fetchone, expected):
+    mock_conn, mock_cursor = db_mocks
+    prime_cursor(mock_cursor, fetchone=fetchone)
 
-    # Normalize SQL queries
-    actual_calls = [
-        normalize_sql(call_args[0][0]) for call_args in mock_cursor.execute.call_args_list
-    ]
-    expected_calls = [
-        normalize_sql("""
-            SELECT schema_name
-            FROM information_schema.schemata;
-        """),
-        normalize_sql("""
-            SELECT EXISTS(
-                SELECT 1
-                FROM information_schema.schemata
-                WHERE schema_name = %s
-            );
-        """)
-    ]
+    geom_col = get_db_geometry_column(mock_conn, 'test_table', 'public')
 
-    # Assert that the normalized SQL queries were executed
-    assert actual_calls == expected_calls
+    assert geom_col == expected
+    assert mock_cursor.execute.call_count == len(fetchone)
+    assert mock_conn.cursor.call_count == len(fetchone)
+    sql, params = mock_cursor.execute.call_args_list[0][0]
+    assert normalize_sql(sql) == _EXPECTED_GEOM_COL_SQL
+    assert params == ('public', 'test_table')
 
-def test_check_schema_exists_not_exists(mocker):
-    mock_conn = MagicMock()
-    mock_cursor = MagicMock()
-    mock_conn.cursor.return_value = mock_cursor
-    mock_cursor.fetchall.return_value = [('public',), ('schema2',)]
-    mock_cursor.fetchone.return_value = (False,)
+def test_get_geometry_metadata(db_mocks):
+    mock_conn, mock_cursor = db_mocks
+    mock_cursor.fetchall.return_value = [('roads', 'geom', 25833, 'LINESTRING'), ('parks', 'geometry', None, None)]
 
-    exists = check_schema_exists(mock_conn, 'nonexistent_schema')
-    assert exists is False
+    result = get_geometry_metadata(mock_conn, 'public')
 
-    actual_calls = [normalize_sql(call.args[0]) for call in mock_cursor.execute.mock_calls]
-    expected_calls = [
-        normalize_sql("SELECT schema_name FROM information_schema.schemata;"),
-        normalize_sql("SELECT EXISTS(SELECT 1 FROM information_schema.schemata WHERE schema_name = %s);")
-    ]
-    assert actual_calls == expected_calls
+    assert result == {'roads': ('geom', 25833, 'LINESTRING'), 'parks': ('geometry', None, None)}
+    mock_cursor.execute.assert_called_once()
+    sql, params = mock_cursor.execute.call_args[0]
+    assert 'LEFT JOIN geometry_columns' in sql
+    assert params == ('public',)
 
-# 5. Testing get_db_geometry_column
-def test_get_db_geometry_column_exists(mocker):
-    # Mock setup
-    mock_conn = MagicMock()
-    mock_cursor = MagicMock()
-    mock_conn.cursor.return_value = mock_cursor
-    mock_cursor.fetchone.return_value = ('geom',)
+# 6. Testing check_table_exists
+@pytest.mark.parametrize("ret, expected", [((True,), True), ((False,), False)])
+def test_check_table_exists(db_mocks, ret, expected):
+    mock_conn, mock_cursor = db_mocks
+    mock_cursor.fetchone.return_value = ret
 
-    # Call the function
-    geom_col = get_db_geometry_column(mock_conn, 'test_table', 'public')
+    assert check_table_exists(mock_conn, 'roads', 'public') is expected
 
-    # Assert
-    assert geom_col == 'geom'
-    expected_sql = """
-    SELECT f_geometry_column
-    FROM geometry_columns
-    WHERE f_table_schema = %s AND f_table_name = %s;
-    """
+    sql, params = mock_cursor.execute.call_args[0]
+    assert normalize_sql(sql) == _EXPECTED_TABLE_EXISTS_SQL
+    assert params == ('public', 'roads')
 
-    # Normalize SQL strings
-    import re
-    actual_sql = re.sub(r'\s+', ' ', mock_cursor.execute.call_args[0][0]).strip()
-    expected_sql = re.sub(r'\s+', ' ', expected_sql).strip()
+def test_has_spatial_index(db_mocks):
+    mock_conn, mock_cursor = db_mocks
+    mock_cursor.fetchone.return_value = (True,)
 
-    assert actual_sql == expected_sql
-    mock_cursor.execute.assert_called_with(mock_cursor.execute.call_args[0][0], ('public', 'test_table'))
+    assert has_spatial_index(mock_conn, 'test_table', 'public', 'geom') is True
 
-def test_get_db_geometry_column_fallback(mocker):
-    # Mock the database connection and cursor
-    mock_conn = MagicMock()
-    mock_cursor = MagicMock()
-    mock_conn.cursor.return_value = mock_cursor
+    sql, params = mock_cursor.execute.call_args[0]
+    assert "am.amname IN ('gist', 'spgist')" in sql
+    assert params == ('public', 'test_table', 'geom')
 
-    # Simulate geometry_columns has no entry
-    mock_cursor.fetchone.side_effect = [None, ('geometry',)]
+def test_suspend_indexes_rebuilds_dropped_index(db_mocks):
+    mock_conn, mock_cursor = db_mocks
+    definition = 'CREATE INDEX test_idx ON public.test_table USING gist (geom)'
+    mock_cursor.fetchall.return_value = [('test_idx', definition)]
 
-    # Call the function
-    geom_col = get_db_geometry_column(mock_conn, 'test_table', 'public')
+    with suspend_indexes(mock_conn, 'test_table', 'public', 'geom'):
+        executed = [c[0][0] for c in mock_cursor.execute.call_args_list]
+        assert executed[-1] == 'DROP INDEX IF EXISTS "public"."test_idx"'
 
-    # Assert
-    assert geom_col == 'geometry'
-    assert mock_cursor.execute.call_count == 2
-    mock_cursor.close.assert_called()
-
-def test_get_db_geometry_column_none(mocker):
-    # Mock the database connection and cursor
-    mock_conn = MagicMock()
-    mock_cursor = MagicMock()
-    mock_conn.cursor.return_value = mock_cursor
+    assert mock_cursor.execute.call_args[0][0] == (
+        'CREATE INDEX IF NOT EXISTS test_idx ON public.test_table USING gist (geom)'
+    )
+    mock_conn.commit.assert_called_once()
 
-    # Simulate no geometry column found
-    mock_cursor.fetchone.side_effect = [None, None]
+@pytest.mark.parametrize("geoms, spgist, expected", [
+    ([_P00, _P11], False, 'spgist'),
+    ([LineString([(0, 0), (1, 1)])], False, 'spgist'),
+    ([Polygon([(0, 0), (1, 0), (1, 1)])], False, 'spgist'),
+    ([_P00, Polygon([(0, 0), (1, 0), (1, 1)])], False, 'gist'),
+    # Shapefile line layers read as a mix of single and multi-part lines
+    ([LineString([(0, 0), (1, 1)]), MultiLineString([[(0, 0), (1, 1)], [(2, 2), (3, 3)]])], False, 'spgist'),
+    ([_P00, MultiPoint([(0, 0), (1, 1)])], False, 'spgist'),
+    ([Polygon([(0, 0), (1, 0), (1, 1)]), MultiPolygon([Polygon([(0, 0), (1, 0), (1, 1)])])], False, 'spgist'),
+    ([Polygon([(0, 0), (1, 0), (1, 1)])], True, 'spgist'),
+])
+def test_choose_index_method(geoms, spgist, expected):
+    gdf = GeoDataFrame(geometry=geoms, crs=_CRS_4326)
 
-    # Call the function
-    geom_col = get_db_geometry_column(mock_conn, 'test_table', 'public')
+    assert choose_index_method(gdf, MagicMock(spgist=spgist)) == expected
 
-    # Assert
-    assert geom_col is None
-    assert mock_cursor.execute.call_count == 2
-    mock_cursor.close.assert_called()
+def test_create_spatial_index_spgist(db_mocks):
+    mock_conn, mock_cursor = db_mocks
+    mock_cursor.fetchone.return_value = ('3.4.2',)
 
-# 6. Testing check_table_exists
-def test_check_table_exists_true(mocker):
-    # Mock setup
-    mock_conn = MagicMock()
-    mock_cursor = MagicMock()
-    mock_conn.cursor.return_value = mock_cursor
-    mock_cursor.fetchone.return_value = (True,)
+    create_spatial_index(mock_conn, 'roads', schema='public', geom_column='geom', method='spgist',
+                         fillfactor=100)
 
-    # Call the function
-    exists = check_table_exists(mock_conn, 'existing_table', 'public')
+    sql = normalize_sql(mock_cursor.execute.call_args[0][0])
+    assert 'USING SPGIST ("geom") WITH (fillfactor = 100);' in sql
+    mock_conn.commit.assert_called_once()
 
-    # Assert
-    assert exists is True
+def test_create_spatial_index_spgist_falls_back_on_old_postgis(db_mocks):
+    mock_conn, mock_cursor = db_mocks
+    mock_cursor.fetchone.return_value = ('2.4.8 r16113',)
 
-    # Normalize SQL strings
-    import re
-    actual_sql = re.sub(r'\s+', ' ', mock_cursor.execute.call_args[0][0]).strip()
-    expected_sql = """
-    SELECT EXISTS (
-        SELECT 1
-        FROM information_schema.tables
-        WHERE table_schema = %s AND table_name = %s
-    );
-    """
-    expected_sql = re.sub(r'\s+', ' ', expected_sql).strip()
+    create_spatial_index(mock_conn, 'roads', schema='public', geom_column='geom', method='spgist')
 
-    assert actual_sql == expected_sql
-    mock_cursor.execute.assert_called_with(mock_cursor.execute.call_args[0][0], ('public', 'existing_table'))
+    sql = normalize_sql(mock_cursor.execute.call_args[0][0])
+    assert sql.endswith('USING GIST ("geom");')
 
-def test_check_table_exists_false(mocker):
+def test_build_spatial_indexes_uses_pooled_connections(mocker):
     mock_conn = MagicMock()
-    mock_cursor = MagicMock()
-    mock_conn.cursor.return_value = mock_cursor
-    mock_cursor.fetchone.return_value = (False,)
+    worker_conns = [MagicMock(), MagicMock()]
+    mock_engine = MagicMock()
+    mock_engine.raw_connection.side_effect = worker_conns
+    mock_create = mocker.patch('dbfriend.dbfriend.create_spatial_index')
+    pending = [('roads', 'geom', 'gist'), ('stops', 'geom', 'spgist')]
 
-    exists = check_table_exists(mock_conn, 'nonexistent_table', 'public')
-    assert exists is False
-
-    # Get actual and expected SQL with exact same formatting
-    actual_sql = normalize_sql(mock_cursor.execute.call_args[0][0])
-    expected_sql = normalize_sql("""
-        SELECT EXISTS (
-            SELECT 1
-            FROM information_schema.tables
-            WHERE table_schema = %s AND table_name = %s
-        );
-    """)
-    assert actual_sql == expected_sql
-    assert mock_cursor.execute.call_args[0][1] == ('public', 'nonexistent_table')
+    build_spatial_indexes(mock_engine, mock_conn, pending, 'public')
+
+    assert mock_engine.raw_connection.call_count == 2
+    built = sorted((c[0][1], c[1]['method'], c[1]['fillfactor']) for c in mock_create.call_args_list)
+    assert built == [('roads', 'gist', 100), ('stops', 'spgist', 100)]
+    assert all(c[0][0] is not mock_conn for c in mock_create.call_args_list)
+    for worker_conn in worker_conns:
+        worker_conn.close.assert_called_once()
 
 # 7. Testing print_geometry_details
-def test_print_geometry_details_no_coordinates(mocker):
+def test_print_geometry_details_no_coordinates(mock_logger):
     row = {
-        'geometry': Point(1.0, 2.0),
+        'geometry': _P12,
         'name': 'Test Point'
     }
-    mock_logger = mocker.patch('dbfriend.dbfriend.logger')
     print_geometry_details(row, coordinates_enabled=False)
     mock_logger.info.assert_called_once_with('Test Point')
 
-def test_print_geometry_details_with_coordinates(mocker):
+def test_print_geometry_details_with_coordinates(mock_logger):
     row = {
-        'geom': Point(1.0, 2.0),
+        'geom': _P12,
         'name': 'Test Point'
     }
-    mock_logger = mocker.patch('dbfriend.dbfriend.logger')
-    
-    with patch('builtins.open', mock_open()) as mock_file:
-        print_geometry_details(row, status="TEST", coordinates_enabled=True)
-    
-    # Assert logger calls
-    expected_calls = [
-        call("\nTEST Geometry Details:"),
-        call("Attributes: name: Test Point"),
-        call("Coordinates: (1.000000, 2.000000)")
-    ]
+    details = io.StringIO()
+
+    print_geometry_details(row, status="TEST", coordinates_enabled=True, details_file=details)
     
-    assert mock_logger.info.call_count == 3
-    mock_logger.info.assert_has_calls(expected_calls, any_order=False)
+    # Assert the details are logged as a single record
+    mock_logger.info.assert_called_once_with(
+        "\nTEST Geometry Details:\nAttributes: name: Test Point\nCoordinates: (1.000000, 2.000000)"
+    )
     
     # Assert file writing
-    mock_file().write.assert_called_once_with(
+    assert details.getvalue() == (
         "\nTEST Geometry Details:\nAttributes: name: Test Point\nCoordinates: (1.000000, 2.000000)\n"
     )
 
+def test_print_geometry_details_uses_open_file(mock_logger):
+    row = {'geom': _P12, 'name': 'Test Point'}
+    mock_logger.isEnabledFor.return_value = False
+    details_file = io.StringIO()
+
+    with patch('builtins.open') as mock_file:
+        print_geometry_details(row, status="TEST", coordinates_enabled=True, details_file=details_file)
+
+    mock_file.assert_not_called()
+    mock_logger.info.assert_not_called()
+    assert details_file.getvalue() == (
+        "\nTEST Geometry Details:\nAttributes: name: Test Point\nCoordinates: (1.000000, 2.000000)\n"
+    )
+
+def test_print_geometry_details_appends_to_default_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'geometry_details.txt').write_text("earlier\n", encoding='utf-8')
+
+    print_geometry_details({'geom': _P12}, status="NEW", coordinates_enabled=True, log=False)
+
+    assert (tmp_path / 'geometry_details.txt').read_text(encoding='utf-8') == (
+        "earlier\n\nNEW Geometry Details:\nAttributes: \nCoordinates: (1.000000, 2.000000)\n"
+    )
+
+def test_print_geometry_details_polygon_rings():
+    polygon = Polygon([(0, 0), (4, 0), (4, 4), (0, 0)], [[(1, 1), (2, 1), (2, 2), (1, 1)]])
+    details_file = io.StringIO()
+
+    print_geometry_details({'geom': polygon}, status="NEW", coordinates_enabled=True, details_file=details_file)
+
+    assert details_file.getvalue() == (
+        "\nNEW Geometry Details:\nAttributes: \nCoordinates:\n"
+        "(0.000000, 0.000000)\n(4.000000, 0.000000)\n(4.000000, 4.000000)\n(0.000000, 0.000000)\n"
+        "Interior Ring 1 Coordinates:\n"
+        "(1.000000, 1.000000)\n(2.000000, 1.000000)\n(2.000000, 2.000000)\n(1.000000, 1.000000)\n"
+    )
+
+def test_write_geometry_details_caps_terminal_output(mocker, tmp_path, monkeypatch, mock_logger):
+    monkeypatch.chdir(tmp_path)
+    mocker.patch('dbfriend.dbfriend.COORDINATES_LOG_LIMIT', 2)
+    gdf = GeoDataFrame({'name': ['a', 'b', 'c']}, geometry=[_P00, _P11, _P22],
+                       crs=_CRS_4326)
+
+    write_geometry_details(gdf, "NEW")
+
+    details = (tmp_path / 'geometry_details.txt').read_text(encoding='utf-8')
+    assert details.count('NEW Geometry Details:') == 3
+    assert 'Attributes: name: c\nCoordinates: (2.000000, 2.000000)' in details
+    assert mock_logger.info.call_count == 3
+    assert 'remaining 1 geometries' in mock_logger.info.call_args[0][0]
+
 # 8. Testing connect_db
-def test_connect_db_success(mocker):
-    # Mock psycopg2.connect to return a mock connection
+@pytest.mark.parametrize("side_effect, success", [(None, True), (Exception("Connection failed"), False)])
+def test_connect_db(mocker, mock_logger, side_effect, success):
     mock_conn = MagicMock()
-    mocker.patch('psycopg2.connect', return_value=mock_conn)
-
-    # Mock logger
-    mock_logger = mocker.patch('dbfriend.dbfriend.logger')
+    mock_connect = mocker.patch('psycopg2.connect', return_value=mock_conn, side_effect=side_effect)
+    mock_sys_exit = mocker.patch('sys.exit')
 
-    # Call the function
     conn = connect_db('dbname', 'user', 'localhost', '5432', 'password')
 
-    # Assert psycopg2.connect was called with correct parameters
-    psycopg2.connect.assert_called_once_with(
+    mock_connect.assert_called_once_with(
         dbname='dbname',
         user='user',
         host='localhost',
         port='5432',
         password='password'
     )
+    if success:
+        mock_logger.info.assert_called_with("Database connection established ✓")
+        assert conn == mock_conn
+        mock_sys_exit.assert_not_called()
+    else:
+        mock_logger.error.assert_called_with("Database connection failed: Connection failed")
+        mock_sys_exit.assert_called_once_with(1)
 
-    # Assert logger.info was called
-    mock_logger.info.assert_called_with("Database connection established ✓")
-
-    # Assert the returned connection is the mock
-    assert conn == mock_conn
-
-def test_connect_db_failure(mocker):
-    # Mock psycopg2.connect to raise an exception
-    mocker.patch('psycopg2.connect', side_effect=Exception("Connection failed"))
+# 9. Testing check_crs_compatibility
+@pytest.mark.parametrize("fetchone, epsg, overwrite, user_input, expected", [
+    # Table does not exist: the data is returned without an SRID lookup
+    ([(False,)], 4326, False, None, 'same'),
+    # Matching SRID
+    ([(True,), (4326,)], 4326, False, None, 'same'),
+    # Mismatch with --overwrite: reprojected to the table's SRID
+    ([(True,), (4326,)], 3857, True, 'y', 'reprojected'),
+    # Mismatch declined at the prompt: skipped
+    ([(True,), (4326,)], 3857, False, 'n', None),
+])
+def test_check_crs_compatibility(db_mocks, mocker, mock_logger, gdf_4326, gdf_3857,
+                                 fetchone, epsg, overwrite, user_input, expected):
+    mock_conn, mock_cursor = db_mocks
+    prime_cursor(mock_cursor, fetchone=fetchone)
+    gdf = (gdf_4326 if epsg == 4326 else gdf_3857).copy()
+    mocker.patch('dbfriend.dbfriend.console').input.return_value = user_input
+    mock_reproject = mocker.patch('dbfriend.dbfriend.reproject_geodataframe', return_value=gdf)
+
+    result = check_crs_compatibility(gdf, mock_conn, 'existing_table', 'geom', MagicMock(overwrite=overwrite))
+
+    assert mock_cursor.execute.call_count == len(fetchone)
+    if len(fetchone) == 2:
+        # The SRID comes from the geometry_columns metadata, not from the table rows
+        srid_query, params = mock_cursor.execute.call_args[0]
+        assert 'FROM geometry_columns' in srid_query
+        assert params == ('public', 'existing_table', 'geom')
+
+    if expected == 'same':
+        assert result is gdf
+        mock_reproject.assert_not_called()
+    elif expected == 'reprojected':
+        mock_reproject.assert_called_once_with(gdf, 4326)
+        mock_logger.info.assert_any_call("Reprojected new data to SRID 4326")
+        assert result is gdf
+    else:
+        mock_logger.info.assert_called_with("Skipping 'public.existing_table' due to CRS mismatch")
+        assert result is None
+
+def test_check_crs_compatibility_uses_existing_tables(gdf_4326):
+    mock_conn = MagicMock()
+    gdf = gdf_4326.copy()
 
-    # Mock logger and sys.exit
-    mock_logger = mocker.patch('dbfriend.dbfriend.logger')
-    mock_sys_exit = mocker.patch('sys.exit')
+    result = check_crs_compatibility(
+        gdf, mock_conn, 'new_table', 'geom', MagicMock(), existing_tables={'other_table'}
+    )
 
-    # Call the function
-    connect_db('dbname', 'user', 'localhost', '5432', 'password')
+    assert result is gdf
+    mock_conn.cursor.assert_not_called()
 
-    # Assert psycopg2.connect was called
-    psycopg2.connect.assert_called_once()
+def test_check_crs_compatibility_samples_unconstrained_column(db_mocks, gdf_4326):
+    mock_conn, mock_cursor = db_mocks
+    prime_cursor(mock_cursor, fetchone=[(0,), (4326,)])
 
-    # Assert logger.error was called with the exception message
-    mock_logger.error.assert_called_with("Database connection failed: Connection failed")
+    gdf = gdf_4326.copy()
 
-    # Assert sys.exit was called with code 1
-    mock_sys_exit.assert_called_once_with(1)
+    result = check_crs_compatibility(gdf, mock_conn, 'existing_table', 'geom', MagicMock(),
+                                     existing_tables={'existing_table'})
 
-# 9. Testing check_crs_compatibility
-def test_check_crs_compatibility_table_not_exists(mocker):
-    # Mock the database connection and cursor
-    mock_conn = MagicMock()
-    mock_cursor = MagicMock()
-    mock_conn.cursor.return_value = mock_cursor
+    assert result is gdf
+    assert 'ST_SRID("geom")' in mock_cursor.execute.call_args[0][0]
 
-    # Simulate table does not exist
-    mock_cursor.execute.return_value = None
-    mock_cursor.fetchone.return_value = (False,)
+def test_configure_bulk_session(db_mocks):
+    mock_conn, mock_cursor = db_mocks
 
-    # Create a mock GeoDataFrame
-    gdf = GeoDataFrame({'geometry': GeoSeries([Point(1, 2)])}, crs='EPSG:4326')
+    configure_bulk_session(mock_conn, '2GB')
 
-    # Call the function
-    result = check_crs_compatibility(gdf, mock_conn, 'nonexistent_table', 'geom', MagicMock())
+    executed = [c[0] for c in mock_cursor.execute.call_args_list]
+    assert executed == [
+        ("SET synchronous_commit = off;",),
+        ("SET work_mem = '256MB';",),
+        ("SET maintenance_work_mem = %s;", ('2GB',))
+    ]
 
+@pytest.mark.parametrize("value, expected", [('1GB', '1GB'), ('512 MB', '512MB'), ('65536', '65536')])
+def test_memory_setting(value, expected):
+    assert memory_setting(value) == expected
+
+def test_memory_setting_rejects_invalid():
+    with pytest.raises(argparse.ArgumentTypeError):
+        memory_setting("1GB -c fsync=off")
+
+def test_backup_tables_checks_existence_once(db_mocks, mocker, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    mock_conn, mock_cursor = db_mocks
+    mock_cursor.fetchall.return_value = [('roads',)]
+    mock_dump = mocker.patch('dbfriend.dbfriend.dump_table')
+
+    backup_info = backup_tables(mock_conn, {'Roads', 'missing'}, 'public')
+
+    calls = mock_cursor.execute.call_args_list
+    assert 'REPEATABLE READ' in calls[0][0][0]
+    assert calls[1][0][1] == ('public', ['missing', 'roads'])
+    mock_dump.assert_called_once_with(mock_cursor, 'public', 'roads', backup_info['roads'])
+    assert list(backup_info) == ['roads']
+    assert backup_info['roads'].endswith('.sql.gz')
+    assert mock_conn.rollback.call_count == 2
+
+def test_dump_table_writes_restorable_script(tmp_path, mocker):
+    # Render identifiers without a live connection
+    mocker.patch.object(psycopg2.sql.Identifier, 'as_string', lambda self, context: render_sql(self))
+    mock_cursor = MagicMock()
+    prime_cursor(mock_cursor, fetchall=[
+        [
+            ('gid', 'integer', True, "nextval('roads_gid_seq'::regclass)", '', '', 'public.roads_gid_seq'),
+            ('Målemetode', 'text', False, "'GPS'::text", '', '', None),
+            ('geom', 'geometry(Point,4326)', False, None, '', '', None),
+            ('geom_hash', 'bytea', False, "decode(md5(st_asbinary(geom)), 'hex'::text)", '', 's', None),
+        ],
+        [('roads_pkey', 'PRIMARY KEY (gid)')],
+        [('CREATE INDEX roads_geom_idx ON public.roads USING gist (geom)',)],
+    ], fetchone=[(42, True)])
+    mock_cursor.copy_expert.side_effect = lambda sql, f: f.write('1\tGPS\t0101000020E6100000\n')
+    backup_file = tmp_path / 'roads_backup.sql.gz'
+
+    dump_table(mock_cursor, 'public', 'roads', str(backup_file))
+
+    assert mock_cursor.copy_expert.call_args[0][0] == (
+        'COPY "public"."roads" ("gid", "Målemetode", "geom") TO STDOUT'
+    )
+    with gzip.open(backup_file, 'rt', encoding='utf-8') as f:
+        assert f.read() == (
+            'CREATE SEQUENCE IF NOT EXISTS public.roads_gid_seq;\n'
+            'CREATE TABLE "public"."roads" (\n'
+            '    "gid" integer DEFAULT nextval(\'roads_gid_seq\'::regclass) NOT NULL,\n'
+            '    "Målemetode" text DEFAULT \'GPS\'::text,\n'
+            '    "geom" geometry(Point,4326),\n'
+            '    "geom_hash" bytea GENERATED ALWAYS AS (decode(md5(st_asbinary(geom)), \'hex\'::text)) STORED,\n'
+            '    CONSTRAINT "roads_pkey" PRIMARY KEY (gid)\n'
+            ');\n'
+            'ALTER SEQUENCE public.roads_gid_seq OWNED BY "public"."roads"."gid";\n'
+            '\n'
+            'COPY "public"."roads" ("gid", "Målemetode", "geom") FROM stdin;\n'
+            '1\tGPS\t0101000020E6100000\n'
+            '\\.\n'
+            '\n'
+            'SELECT pg_catalog.setval(pg_get_serial_sequence(\'"public"."roads"\', \'gid\'), 42, true);\n'
+            '\n'
+            'CREATE INDEX roads_geom_idx ON public.roads USING gist (geom);\n'
+        )
 
-    # Assert the GeoDataFrame is returned as is
-    assert_frame_equal(result, gdf)
+def test_dump_table_keeps_identity_columns(tmp_path, mocker):
+    mocker.patch.object(psycopg2.sql.Identifier, 'as_string', lambda self, context: render_sql(self))
+    mock_cursor = MagicMock()
+    prime_cursor(mock_cursor, fetchall=[
+        [('id', 'bigint', True, None, 'a', '', 'public.roads_id_seq')], [], []
+    ], fetchone=[(1, False)])
+    backup_file = tmp_path / 'roads_backup.sql.gz'
+
+    dump_table(mock_cursor, 'public', 'roads', str(backup_file))
+
+    with gzip.open(backup_file, 'rt', encoding='utf-8') as f:
+        script = f.read()
+    # The identity column creates its own sequence, which is only moved to its current value
+    assert 'CREATE SEQUENCE' not in script
+    assert '"id" bigint GENERATED ALWAYS AS IDENTITY NOT NULL' in script
+    assert "pg_get_serial_sequence('\"public\".\"roads\"', 'id'), 1, false);" in script
+
+def test_backup_tables_skips_table_on_invalid_identifier(db_mocks, mocker, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    mock_conn, mock_cursor = db_mocks
+    mock_cursor.fetchall.return_value = [('parks',), ('roads',)]
+    mocker.patch('dbfriend.dbfriend.dump_table', side_effect=[ValueError('Invalid identifier'), None])
+
+    backup_info = backup_tables(mock_conn, {'parks', 'roads'}, 'public')
+
+    # The failing table is skipped and the run goes on with the next one
+    assert list(backup_info) == ['roads']
+    assert 'ROLLBACK TO SAVEPOINT backup_table' in executed_sql(mock_cursor)
+
+def test_manage_old_backups_keeps_three(tmp_path):
+    names = [f"roads_backup_2024010{day}_000000.sql" for day in range(1, 3)]
+    names += [f"roads_backup_2024010{day}_000000.dump" for day in range(3, 5)]
+    names += ["roads_backup_20240105_000000.sql.gz"]
+    for name in names + ['parks_backup_20240101_000000.dump']:
+        (tmp_path / name).write_text('')
+
+    manage_old_backups(str(tmp_path), 'roads')
+
+    assert sorted(os.listdir(tmp_path)) == [
+        'parks_backup_20240101_000000.dump',
+        'roads_backup_20240103_000000.dump',
+        'roads_backup_20240104_000000.dump',
+        'roads_backup_20240105_000000.sql.gz',
+    ]
 
-    # Assert cursor was closed
-    mock_cursor.close.assert_called_once()
+# 10. Testing get_existing_tables
+def test_get_existing_tables(db_mocks, mocker):
+    mock_conn, mock_cursor = db_mocks
+    mock_cursor.fetchall.return_value = [('table1',), ('table2',)]
 
-def test_check_crs_compatibility_compatible(mocker):
-    mock_conn = MagicMock()
-    mock_cursor = MagicMock()
-    mock_conn.cursor.return_value = mock_cursor
-    mock_cursor.fetchone.return_value = (4326,)
+    # Call the function
+    tables = get_existing_tables(mock_conn, 'public')
 
-    gdf = GeoDataFrame({'geometry': GeoSeries([Point(1, 2)])}, crs='EPSG:4326')
-    mock_logger = mocker.patch('dbfriend.dbfriend.logger')
+    # Assert
+    assert tables == {'table1', 'table2'}
 
-    result = check_crs_compatibility(gdf, mock_conn, 'existing_table', 'geom', MagicMock())
-    assert_geodataframe_equal(result, gdf)
+    sql, params = mock_cursor.execute.call_args[0]
+    assert normalize_sql(sql) == _EXPECTED_EXISTING_TABLES_SQL
+    assert params == ('public',)
 
-def test_check_crs_compatibility_incompatible_overwrite(mocker):
+# 11. Testing append_geometries
+def test_append_geometries(db_mocks):
+    """Test that append_geometries copies the rows straight into the table"""
+    mock_conn, mock_cursor = db_mocks
+    mock_cursor.rowcount = 1
+    
+    # Create test GeoDataFrame
+    gdf = GeoDataFrame({'geom': [_P11]}, geometry='geom', crs=_CRS_4326)
+    
+    result = append_geometries(mock_conn, gdf, 'test_table')
+    assert result == 1
+    
+    # Verify the rows were loaded with COPY, with no second duplicate check
+    copy_sql, buffer = mock_cursor.copy_expert.call_args[0]
+    assert normalize_sql(copy_sql) == normalize_sql(
+        'COPY "public"."test_table" ("geom") FROM STDIN WITH (FORMAT csv, NULL \'\\N\')'
+    )
+    assert buffer.getvalue().startswith('0101000020E6100000')
+    mock_cursor.execute.assert_not_called()
+    mock_conn.commit.assert_called_once()
+
+def test_append_geometries_reports_failure(db_mocks):
+    mock_conn, mock_cursor = db_mocks
+    mock_cursor.copy_expert.side_effect = psycopg2.Error("permission denied")
+    gdf = GeoDataFrame({'geom': [_P11]}, geometry='geom', crs=_CRS_4326)
+
+    assert append_geometries(mock_conn, gdf, 'test_table') is None
+    mock_conn.rollback.assert_called_once()
+
+@pytest.mark.parametrize("rows, table_rows, rebuild_index, suspended", [
+    (INDEX_REBUILD_THRESHOLD, 100000, False, True),
+    (INDEX_REBUILD_THRESHOLD, 10000000, False, False),
+    (1, 100000, False, False),
+    (1, 100000, True, True),
+])
+def test_append_new_geometries_rebuilds_index_for_large_batches(mocker, rows, table_rows, rebuild_index, suspended):
     mock_conn = MagicMock()
-    mock_cursor = MagicMock()
-    mock_conn.cursor.return_value = mock_cursor
-    mock_cursor.fetchone.return_value = (4326,)
-
-    gdf = GeoDataFrame({'geometry': GeoSeries([Point(1, 2)])}, crs='EPSG:3857')
-    mock_logger = mocker.patch('dbfriend.dbfriend.logger')
-    mock_console = mocker.patch('dbfriend.dbfriend.console')
-    mock_console.input.return_value = 'y'
+    gdf = GeoDataFrame({'geom': shapely.points(np.ones((rows, 2)))}, geometry='geom', crs=_CRS_4326)
+    mocker.patch('dbfriend.dbfriend.estimate_row_count', return_value=table_rows)
+    mocker.patch('dbfriend.dbfriend.has_spatial_index', return_value=True)
+    mock_suspend = mocker.patch('dbfriend.dbfriend.suspend_indexes')
+    mock_append = mocker.patch('dbfriend.dbfriend.append_geometries', return_value=rows)
+
+    args = MagicMock(rebuild_index=rebuild_index)
+    assert append_new_geometries(mock_conn, gdf, 'test_table', 'public', 'geom', args) == rows
+
+    assert mock_suspend.called is suspended
+    mock_append.assert_called_once_with(mock_conn, ANY, 'test_table', 'public')
+    appended = mock_append.call_args[0][1]
+    assert list(appended.columns) == list(gdf.columns) and appended.crs == gdf.crs
+    assert (shapely.to_wkb(appended.geometry.values) == shapely.to_wkb(gdf.geometry.values)).all()
+
+def test_sort_by_hilbert_orders_along_curve():
+    gdf = GeoDataFrame(
+        {'name': ['far', 'missing', 'near', 'middle'],
+         'geom': [Point(100, 100), None, _P00, _P11]},
+        geometry='geom', crs=_CRS_4326
+    )
 
-    with patch.object(gdf, 'to_crs', return_value=gdf) as mock_to_crs:
-        args = MagicMock()
-        args.overwrite = True
-        result = check_crs_compatibility(gdf, mock_conn, 'existing_table', 'geom', args)
-        mock_to_crs.assert_called_once_with(epsg=4326)
+    result = sort_by_hilbert(gdf)
 
-    mock_logger.info.assert_any_call("Reprojected new data to SRID 4326")
-    assert_geodataframe_equal(result, gdf)
+    assert result['name'].tolist() == ['near', 'middle', 'far', 'missing']
+    assert sorted(result.index) == list(gdf.index)
 
-def test_check_crs_compatibility_incompatible_skip(mocker):
-    # Mock the database connection and cursor
-    mock_conn = MagicMock()
-    mock_cursor = MagicMock()
-    mock_conn.cursor.return_value = mock_cursor
+def test_estimate_row_count(db_mocks):
+    mock_conn, mock_cursor = db_mocks
+    mock_cursor.fetchone.return_value = (1234.0,)
 
-    # Simulate table exists with SRID 4326
-    mock_cursor.fetchone.return_value = (4326,)
+    assert estimate_row_count(mock_conn, 'roads', 'public') == 1234.0
+    assert mock_cursor.execute.call_args[0][1] == ('public', 'roads')
 
-    # Create a mock GeoDataFrame with different CRS
-    gdf = GeoDataFrame({'geometry': GeoSeries([Point(1, 2)])}, crs='EPSG:3857')
+def test_update_geometries_copies_into_staging(db_mocks, mocker):
+    mock_conn, mock_cursor = db_mocks
+    mock_cursor.fetchall.return_value = [
+        ('osm_id', 'bigint'), ('name', 'text'), ('geom', 'geometry(Geometry,4326)')
+    ]
+    mock_copy = mocker.patch('dbfriend.dbfriend.bulk_copy_geodataframe')
+
+    gdf = GeoDataFrame({
+        'osm_id': [1, 2],
+        'name': ['a', None],
+        'geom': [_P11, _P22]
+    }, geometry='geom', crs=_CRS_4326)
+
+    update_geometries(mock_conn, gdf, 'test_table', unique_id_column='osm_id')
+
+    # All rows are copied into one typed staging table and applied with a single UPDATE
+    mock_copy.assert_called_once_with(mock_conn, gdf, '_upd_test_table', schema='pg_temp')
+    executed = executed_sql(mock_cursor)[1:]
+    assert executed[1] == ('CREATE TEMP TABLE "_upd_test_table" ("osm_id" bigint, "name" text, '
+                           '"geom" geometry(Geometry,4326))')
+    assert executed[2] == ('UPDATE "public"."test_table" t SET "name" = s."name", "geom" = s."geom" '
+                           'FROM pg_temp."_upd_test_table" s WHERE t."osm_id" = s."osm_id" '
+                           'AND (t."name" IS DISTINCT FROM s."name" '
+                           'OR ST_AsEWKB(t."geom") IS DISTINCT FROM ST_AsEWKB(s."geom"))')
+    mock_conn.commit.assert_called_once()
+
+def test_update_geometries_adds_new_columns_at_once(db_mocks, mocker):
+    mock_conn, mock_cursor = db_mocks
+    mock_cursor.fetchall.return_value = [('osm_id', 'bigint'), ('geom', 'geometry(Geometry,4326)')]
+    mocker.patch('dbfriend.dbfriend.bulk_copy_geodataframe')
+
+    gdf = GeoDataFrame({
+        'osm_id': [1],
+        'lanes': [2],
+        'oneway': [True],
+        'geom': [_P11]
+    }, geometry='geom', crs=_CRS_4326)
+
+    update_geometries(mock_conn, gdf, 'test_table', unique_id_column='osm_id')
+
+    executed = executed_sql(mock_cursor)
+    assert executed[1] == ('ALTER TABLE "public"."test_table" ADD COLUMN IF NOT EXISTS "lanes" INTEGER, '
+                           'ADD COLUMN IF NOT EXISTS "oneway" BOOLEAN')
+    assert executed[3] == ('CREATE TEMP TABLE "_upd_test_table" ("osm_id" bigint, "lanes" INTEGER, '
+                           '"oneway" BOOLEAN, "geom" geometry(Geometry,4326))')
+
+def test_to_hex_ewkb_includes_srid():
+    gdf = GeoDataFrame(geometry=[_P12, None], crs=_CRS_4326)
+
+    ewkb = to_hex_ewkb(gdf)
+
+    # Point flag with the SRID bit set, followed by SRID 4326 (0x10E6) little-endian
+    assert ewkb[0].startswith('0101000020E6100000')
+    assert ewkb[1] is None
+
+def test_bulk_copy_geodataframe_chunks_rows(db_mocks):
+    mock_conn, mock_cursor = db_mocks
+    copied = []
+    mock_cursor.copy_expert.side_effect = lambda sql, buffer: copied.append(buffer.read())
+    gdf = GeoDataFrame({
+        'name': ['a', 'b', 'c'],
+        'geom': [_P00, _P11, _P22]
+    }, geometry='geom', crs=_CRS_4326)
+
+    bulk_copy_geodataframe(mock_conn, gdf, 'roads', 'public', chunksize=2)
+
+    assert mock_cursor.copy_expert.call_count == 2
+    assert [len(chunk.splitlines()) for chunk in copied] == [2, 1]
+    assert render_sql(mock_cursor.copy_expert.call_args[0][0]) == (
+        'COPY "public"."roads" ("name", "geom") FROM STDIN WITH (FORMAT csv, NULL \'\\N\')'
+    )
 
-    # Mock logger and console.input
-    mock_logger = mocker.patch('dbfriend.dbfriend.logger')
-    mock_console = mocker.patch('dbfriend.dbfriend.console')
-    mock_console.input.return_value = 'n'
+    bulk_copy_geodataframe(mock_conn, gdf, 'roads', 'public', freeze=True)
 
-    # Call the function
-    args = MagicMock()
-    args.overwrite = False
+    assert render_sql(mock_cursor.copy_expert.call_args[0][0]) == (
+        'COPY "public"."roads" ("name", "geom") FROM STDIN WITH (FORMAT csv, NULL \'\\N\', FREEZE)'
+    )
 
-    result = check_crs_compatibility(gdf, mock_conn, 'existing_table', 'geom', args)
+def test_bulk_copy_geodataframe_writes_nulls_distinctly(db_mocks):
+    mock_conn, mock_cursor = db_mocks
+    mock_cursor.copy_expert.side_effect = lambda sql, buffer: setattr(mock_cursor, 'copied', buffer.read())
+    # An integer field with a missing value comes back from pyogrio as float64
+    gdf = GeoDataFrame({
+        'lanes': [2.0, np.nan],
+        'width': [3.5, 4.0],
+        'name': ['', None],
+        'geom': [_P00, None]
+    }, geometry='geom', crs=_CRS_4326)
+
+    bulk_copy_geodataframe(mock_conn, gdf, 'roads', 'public')
+
+    assert mock_cursor.copied.splitlines() == [
+        '2,3.5,,0101000020E610000000000000000000000000000000000000',
+        '\\N,4.0,\\N,\\N',
+    ]
 
-    # Assert logger.info was called about skipping
-    mock_logger.info.assert_called_with("Skipping 'existing_table' due to CRS mismatch")
+def test_bulk_copy_geodataframe_quotes_any_column_name(db_mocks):
+    mock_conn, mock_cursor = db_mocks
+    gdf = GeoDataFrame({'Målemetode': ['GPS'], 'geom': [_P00]}, geometry='geom', crs=_CRS_4326)
 
-    # Assert the function returns None
-    assert result is None
+    bulk_copy_geodataframe(mock_conn, gdf, 'roads', 'public')
 
-    # Assert cursor was closed
-    mock_cursor.close.assert_called_once()
+    assert render_sql(mock_cursor.copy_expert.call_args[0][0]) == (
+        'COPY "public"."roads" ("Målemetode", "geom") FROM STDIN WITH (FORMAT csv, NULL \'\\N\')'
+    )
 
-# 10. Testing get_existing_tables
-def test_get_existing_tables(mocker):
-    # Mock setup
+def test_copy_insert_method():
     mock_conn = MagicMock()
     mock_cursor = MagicMock()
-    mock_conn.cursor.return_value = mock_cursor
-    mock_cursor.fetchall.return_value = [('table1',), ('table2',)]
+    mock_conn.connection.dbapi_connection.cursor.return_value.__enter__.return_value = mock_cursor
+    mock_cursor.copy_expert.side_effect = lambda sql, buffer: setattr(mock_cursor, 'copied', buffer.read())
+    table = MagicMock()
+    table.name = 'roads'
+    table.schema = 'public'
+
+    copy_insert_method(table, mock_conn, ['Målemetode', 'geom'], iter([('a', '0101'), (None, '0102')]))
+
+    sql = render_sql(mock_cursor.copy_expert.call_args[0][0])
+    assert sql == 'COPY "public"."roads" ("Målemetode", "geom") FROM STDIN WITH (FORMAT csv, NULL \'\\N\')'
+    assert mock_cursor.copied == 'a,0101\r\n\\N,0102\r\n'
+
+def test_import_with_to_postgis_copies_rows(mocker):
+    mock_sa_conn = MagicMock()
+    gdf = GeoDataFrame({'name': ['a'], 'geom': [_P00]}, geometry='geom', crs=_CRS_4326)
+    # autospec checks every call against the real signatures
+    mock_to_postgis = mocker.patch.object(GeoDataFrame, 'to_postgis', autospec=True)
+    mock_to_sql = mocker.patch.object(pd.DataFrame, 'to_sql', autospec=True)
+
+    assert import_with_to_postgis(mock_sa_conn, gdf, 'roads', 'public') is True
+
+    # to_postgis only creates the empty table
+    created = mock_to_postgis.call_args[0][0]
+    assert created.empty and list(created.columns) == ['name', 'geom']
+    rows = mock_to_sql.call_args[0][0]
+    assert list(rows['geom']) == list(to_hex_ewkb(gdf))
+    assert mock_to_sql.call_args[1]['method'] is copy_insert_method
+    assert mock_sa_conn.begin_nested.call_count == 1
+
+def test_import_with_to_postgis_falls_back_to_multi(mocker):
+    mock_sa_conn = MagicMock()
+    gdf = GeoDataFrame({'geom': [_P00]}, geometry='geom', crs=_CRS_4326)
+    mocker.patch.object(GeoDataFrame, 'to_postgis', autospec=True)
+    mock_to_sql = mocker.patch.object(
+        pd.DataFrame, 'to_sql', autospec=True, side_effect=[Exception('COPY not allowed'), None]
+    )
 
-    # Call the function
-    tables = get_existing_tables(mock_conn, 'public')
+    assert import_with_to_postgis(mock_sa_conn, gdf, 'roads', 'public') is True
 
-    # Assert
-    assert tables == ['table1', 'table2']
+    methods = [c[1]['method'] for c in mock_to_sql.call_args_list]
+    assert methods == [copy_insert_method, 'multi']
+    assert [c[1]['chunksize'] for c in mock_to_sql.call_args_list] == [10000, 5000]
+    assert mock_sa_conn.begin_nested.call_count == 2
 
-    # Normalize SQL strings
-    import re
-    actual_sql = re.sub(r'\s+', ' ', mock_cursor.execute.call_args[0][0]).strip()
-    expected_sql = """
-    SELECT table_name
-    FROM information_schema.tables
-    WHERE table_schema = %s;
-    """
-    expected_sql = re.sub(r'\s+', ' ', expected_sql).strip()
+def test_import_with_to_postgis_reports_failure(mocker):
+    gdf = GeoDataFrame({'geom': [_P00]}, geometry='geom', crs=_CRS_4326)
+    mocker.patch.object(GeoDataFrame, 'to_postgis', autospec=True)
+    mocker.patch.object(pd.DataFrame, 'to_sql', autospec=True, side_effect=Exception('permission denied'))
 
-    assert actual_sql == expected_sql
-    mock_cursor.execute.assert_called_with(mock_cursor.execute.call_args[0][0], ('public',))
-
-# 11. Testing append_geometries
-def test_append_geometries():
-    """Test the new append_geometries function with schema handling"""
-    mock_conn = MagicMock()
-    mock_cursor = MagicMock()
-    mock_conn.cursor.return_value = mock_cursor
-    
-    # Create a proper mock for SQLAlchemy engine
-    mock_engine = MagicMock()
-    mock_engine.connect.return_value = MagicMock()
-    
-    # Create test GeoDataFrame
-    gdf = GeoDataFrame({'geometry': [Point(1, 1)]}, crs='EPSG:4326')
-    
-    # Mock to_postgis to avoid actual database operations
-    with patch('geopandas.GeoDataFrame.to_postgis') as mock_to_postgis:
-        mock_to_postgis.return_value = None
-        
-        # Test with default schema
-        result = append_geometries(mock_conn, mock_engine, gdf, 'test_table')
-        assert result is True
-        
-        # Verify to_postgis was called correctly
-        mock_to_postgis.assert_called_with(
-            'temp_test_table',
-            mock_engine,
-            schema='public',
-            if_exists='replace',
-            index=False
-        )
+    assert import_with_to_postgis(MagicMock(), gdf, 'roads', 'public') is False
 
 # 12. Testing create_generic_geometry_table
-def test_create_generic_geometry_table():
+def test_create_generic_geometry_table(db_mocks):
     """Test table creation with generic geometry type"""
-    mock_conn = MagicMock()
-    mock_cursor = MagicMock()
-    mock_conn.cursor.return_value = mock_cursor
+    mock_conn, mock_cursor = db_mocks
     mock_engine = MagicMock()
     
     # Mock cursor.fetchone() to return a geometry column name
@@ -545,65 +990,424 @@ def test_create_generic_geometry_table():
     create_table_sql = next(sql for sql in sql_calls if 'CREATE TABLE' in sql)
     
     # Verify SQL contains generic geometry type
-    expected_sql = 'CREATE TABLE public.test_table (geom geometry(Geometry, 4326))'
+    expected_sql = 'CREATE TABLE "public"."test_table" (gid SERIAL PRIMARY KEY, geom geometry(Geometry, %s))'
     assert normalize_sql(expected_sql) in normalize_sql(create_table_sql)
 
+    # The spatial index is built by the caller after the load
+    assert not any('CREATE INDEX' in sql for sql in sql_calls)
+
+def test_create_table_from_geodataframe(db_mocks):
+    mock_conn, mock_cursor = db_mocks
+    gdf = GeoDataFrame({
+        'name': ['a', 'b'],
+        'lanes': [1, 2],
+        'width': [3.5, None],
+        'geom': [_P00, _P11]
+    }, geometry='geom', crs=_CRS_4326)
+
+    create_table_from_geodataframe(mock_conn, gdf, 'roads', 'public')
+
+    executed = [render_sql(c[0][0]) for c in mock_cursor.execute.call_args_list]
+    assert executed == [
+        'DROP TABLE IF EXISTS "public"."roads"',
+        'CREATE TABLE "public"."roads" ("name" TEXT, "lanes" BIGINT, '
+        '"width" DOUBLE PRECISION, "geom" geometry(Point, 4326))'
+    ]
+
+def test_create_table_from_geodataframe_column_names_and_timestamps(db_mocks):
+    mock_conn, mock_cursor = db_mocks
+    gdf = GeoDataFrame({
+        'Målemetode': ['GPS'],
+        'målt dato': pd.to_datetime(['2024-05-01 12:00']).tz_localize('Europe/Oslo'),
+        'registrert': pd.to_datetime(['2024-05-01 12:00']),
+        'geom': [_P00]
+    }, geometry='geom', crs=_CRS_4326)
+
+    create_table_from_geodataframe(mock_conn, gdf, 'roads', 'public')
+
+    assert render_sql(mock_cursor.execute.call_args[0][0]) == (
+        'CREATE TABLE "public"."roads" ("Målemetode" TEXT, "målt dato" TIMESTAMPTZ, '
+        '"registrert" TIMESTAMP, "geom" geometry(Point, 4326))'
+    )
+
+@pytest.mark.parametrize("geoms, expected", [
+    ([Point(0, 0, 1), Point(1, 1, 2), None], 'geometry(PointZ, 4326)'),
+    ([Point(0, 0, 1), Point(1, 1)], 'geometry'),
+    ([Point(0, 0), LineString([(0, 0), (1, 1)])], 'geometry(Geometry, 4326)'),
+])
+def test_create_table_from_geodataframe_z_dimension(db_mocks, geoms, expected):
+    mock_conn, mock_cursor = db_mocks
+    gdf = GeoDataFrame({'geom': geoms}, geometry='geom', crs=_CRS_4326)
+
+    create_table_from_geodataframe(mock_conn, gdf, 'roads', 'public')
+
+    assert render_sql(mock_cursor.execute.call_args[0][0]) == f'CREATE TABLE "public"."roads" ("geom" {expected})'
+
+def test_ensure_geom_hash_index_creates_expression_index(db_mocks, mock_logger):
+    mock_conn, mock_cursor = db_mocks
+    mock_cursor.fetchone.return_value = (False,)
+    events = []
+    mock_logger.info.side_effect = lambda message: events.append('log')
+    mock_cursor.execute.side_effect = lambda sql, *params: events.append(sql.split()[0])
+
+    assert ensure_geom_hash_index(mock_conn, 'roads', 'public', 'geom') is True
+
+    # The index build is announced before it starts
+    assert events == ['SELECT', 'log', 'SAVEPOINT', 'CREATE', 'RELEASE']
+    assert mock_cursor.execute.call_args_list[0][0][1] == ('"public"."roads_geom_hash_idx"',)
+
+    # The indexed expression is exactly the one compare_geometries filters on
+    executed = executed_sql(mock_cursor)[1:]
+    assert executed == [
+        'SAVEPOINT add_geom_hash',
+        'CREATE INDEX IF NOT EXISTS "roads_geom_hash_idx" ON "public"."roads" '
+        '((DECODE(MD5(ST_AsBinary("geom")), \'hex\')))',
+        'RELEASE SAVEPOINT add_geom_hash',
+    ]
+
+def test_ensure_geom_hash_index_keeps_existing_index(db_mocks):
+    mock_conn, mock_cursor = db_mocks
+    mock_cursor.fetchone.return_value = (True,)
+
+    assert ensure_geom_hash_index(mock_conn, 'roads', 'public', 'geom') is True
+    mock_cursor.execute.assert_called_once()
+
+def test_ensure_geom_hash_index_falls_back_on_error(db_mocks):
+    mock_conn, mock_cursor = db_mocks
+    mock_cursor.fetchone.return_value = (False,)
+    mock_cursor.execute.side_effect = [None, None, psycopg2.Error("must be owner"), None]
+
+    assert ensure_geom_hash_index(mock_conn, 'roads', 'public', 'geom') is False
+    assert mock_cursor.execute.call_args[0][0] == "ROLLBACK TO SAVEPOINT add_geom_hash"
+
 # 13. Testing compare_geometries
-def test_compare_geometries():
+def test_compare_geometries(db_mocks, mocker):
     """Test geometry comparison logic with hashing"""
-    mock_conn = MagicMock()
-    mock_cursor = MagicMock()
-    mock_conn.cursor.return_value = mock_cursor
+    mock_conn, context_cursor = db_mocks
     
     # Mock get_db_geometry_column
     with patch('dbfriend.dbfriend.get_db_geometry_column') as mock_get_geom:
         mock_get_geom.return_value = 'geom'
         
-        # Set up the context manager mock properly
-        context_cursor = MagicMock()
-        context_cursor.fetchall.return_value = [('hash1',)]
+        # The table already has the geom_hash index
+        context_cursor.fetchone.return_value = (True,)
+        # The server reports the position of each incoming row it already holds
+        context_cursor.__iter__.return_value = iter([(0,)])
         
-        # Configure the cursor context manager
-        cursor_cm = MagicMock()
-        cursor_cm.__enter__.return_value = context_cursor
-        cursor_cm.__exit__.return_value = None
-        mock_conn.cursor.return_value = cursor_cm
+        # Create GeoDataFrame with the geometry column already named 'geom'
+        gdf = GeoDataFrame({
+            'geom': shapely.points(np.array([[1, 1], [2, 2]]))
+        }, geometry='geom', crs=_CRS_4326)
         
-        # Create test GeoDataFrame with known hashes
-        with patch('geopandas.GeoSeries.apply') as mock_apply:
-            # Mock the apply function to return predetermined hashes
-            mock_apply.return_value = pd.Series(['hash1', 'hash2'])
-            
-            # Create GeoDataFrame with the geometry column already named 'geom'
-            gdf = GeoDataFrame({
-                'geom': [Point(1, 1), Point(2, 2)]
-            }, geometry='geom', crs='EPSG:4326')
-            
+        to_wkb = mocker.patch('dbfriend.dbfriend.shapely.to_wkb', wraps=shapely.to_wkb)
+        with patch('dbfriend.dbfriend.psycopg2.extras.execute_values') as mock_execute_values:
             new_geoms, updated_geoms, identical_geoms = compare_geometries(
                 gdf, mock_conn, 'test_table', schema='public'
             )
-            
-            # Verify SQL was executed
-            assert context_cursor.execute.called, "SQL execute should have been called"
-            sql_call = context_cursor.execute.call_args[0][0]
-            assert 'SELECT MD5(ST_AsBinary(geom))' in sql_call.replace('\n', ' '), "SQL should include hash computation"
-            
-            # Check return values match expected behavior
-            assert new_geoms is not None, "Should have new geometries"
-            assert updated_geoms is None, "Should have no updated geometries"
-            assert identical_geoms is not None, "Should have identical geometries"
-            
-            # Verify the contents
-            assert len(new_geoms) == 1, "Should have one new geometry"
-            assert new_geoms.iloc[0].geom.equals(Point(2, 2)), "New geometry should be Point(2, 2)"
-            
-            assert len(identical_geoms) == 1, "Should have one identical geometry"
-            assert identical_geoms.iloc[0].geom.equals(Point(1, 1)), "Identical geometry should be Point(1, 1)"
+
+        # All geometries are serialized in one vectorized call over the geometry array
+        to_wkb.assert_called_once()
+        assert list(to_wkb.call_args[0][0]) == list(gdf.geometry.values)
+        
+        # Verify the incoming hashes were uploaded
+        wkbs = shapely.to_wkb(gdf.geometry.values, byte_order=1, flavor='iso')
+        uploaded = list(mock_execute_values.call_args[0][2])
+        assert uploaded == [(i, hashlib.md5(wkb).digest()) for i, wkb in enumerate(wkbs)]
+
+        # Verify SQL was executed
+        assert context_cursor.execute.called, "SQL execute should have been called"
+        sql_calls = executed_sql(context_cursor)
+        assert any('DECODE(MD5(ST_AsBinary(t."geom")), \'hex\') = i.geom_hash' in sql for sql in sql_calls), \
+            "SQL should semi-join the uploaded hashes"
+        assert call(name='identical_hashes') in mock_conn.cursor.call_args_list, \
+            "Identical positions should be streamed through a named cursor"
+        
+        # Check return values match expected behavior
+        assert new_geoms is not None, "Should have new geometries"
+        assert updated_geoms is None, "Should have no updated geometries"
+        assert identical_geoms is not None, "Should have identical geometries"
+        
+        # Verify the contents
+        assert len(new_geoms) == 1, "Should have one new geometry"
+        assert new_geoms.iloc[0].geom.equals(_P22), "New geometry should be Point(2, 2)"
+        
+        assert len(identical_geoms) == 1, "Should have one identical geometry"
+        assert identical_geoms.iloc[0].geom.equals(_P11), "Identical geometry should be Point(1, 1)"
+
+def test_read_spatial_file_reprojects(tmp_path):
+    path = tmp_path / 'points.gpkg'
+    GeoDataFrame({'name': ['a']}, geometry=[Point(10, 60)], crs=_CRS_4326).to_file(path)
+    args = MagicMock(epsg=3857)
+
+    gdf = read_spatial_file(str(path), 'points.gpkg', args)
+
+    assert gdf.crs.to_epsg() == 3857
+    assert list(gdf.columns) == ['name', 'geometry']
+
+def test_read_spatial_files_skips_unreadable(tmp_path, mock_logger):
+    path = tmp_path / 'points.gpkg'
+    GeoDataFrame({'name': ['a']}, geometry=[Point(10, 60)], crs=_CRS_4326).to_file(path)
+    infos = [
+        {'file': 'missing.gpkg', 'full_path': str(tmp_path / 'missing.gpkg')},
+        {'file': 'points.gpkg', 'full_path': str(path)},
+    ]
+
+    gdfs = read_spatial_files(infos, MagicMock(epsg=None, jobs=1), columns=[])
+
+    assert len(gdfs) == 1
+    assert list(gdfs[0].columns) == ['geometry']
+    assert "missing.gpkg" in mock_logger.error.call_args[0][0]
+
+def write_tile_files(tmp_path, names):
+    """Write one single-point GeoPackage per name and return their file info dicts."""
+    infos = []
+    for name in names:
+        path = tmp_path / name
+        GeoDataFrame({'name': [name]}, geometry=[Point(10, 60)], crs=_CRS_4326).to_file(path)
+        infos.append({'file': name, 'full_path': str(path)})
+    return infos
+
+def test_read_spatial_files_shares_one_process_pool(tmp_path, mocker, mock_logger):
+    mock_logger.getEffectiveLevel.return_value = logging.INFO
+    roads = write_tile_files(tmp_path, ('roads_1.gpkg', 'roads_2.gpkg'))
+    parks = write_tile_files(tmp_path, ('parks_1.gpkg', 'parks_2.gpkg'))
+    mocker.patch('dbfriend.dbfriend.USE_ARROW', False)
+    mocker.patch('dbfriend.dbfriend.PROCESS_READ_THRESHOLD', 0)
+    process_pool = mocker.patch('dbfriend.dbfriend.ProcessPoolExecutor', wraps=ProcessPoolExecutor)
+    thread_pool = mocker.patch('dbfriend.dbfriend.ThreadPoolExecutor')
+    args = MagicMock(epsg=3857, jobs=1)
+
+    with file_read_pool({'roads': roads, 'parks': parks}, args) as pool:
+        gdfs = read_spatial_files(roads, args, pool=pool) + read_spatial_files(parks, args, pool=pool)
+
+    # Both tables are read by the same spawned workers
+    process_pool.assert_called_once()
+    assert process_pool.call_args[1]['mp_context'].get_start_method() == 'spawn'
+    thread_pool.assert_not_called()
+    assert [gdf['name'][0] for gdf in gdfs] == ['roads_1.gpkg', 'roads_2.gpkg', 'parks_1.gpkg', 'parks_2.gpkg']
+    assert all(gdf.crs.to_epsg() == 3857 for gdf in gdfs)
+
+@pytest.mark.parametrize("use_arrow, jobs, threshold", [
+    (True, 1, 0),
+    (False, 2, 0),
+    (False, 1, None),
+])
+def test_file_read_pool_reads_in_threads(tmp_path, mocker, use_arrow, jobs, threshold):
+    infos = write_tile_files(tmp_path, ('a.gpkg', 'b.gpkg'))
+    mocker.patch('dbfriend.dbfriend.USE_ARROW', use_arrow)
+    if threshold is not None:
+        mocker.patch('dbfriend.dbfriend.PROCESS_READ_THRESHOLD', threshold)
+    process_pool = mocker.patch('dbfriend.dbfriend.ProcessPoolExecutor')
+    args = MagicMock(epsg=None, jobs=jobs)
+
+    # With Arrow, under --jobs, or for files too small to pay for the workers, no processes start
+    with file_read_pool({'tiles': infos}, args) as pool:
+        assert pool is None
+
+    process_pool.assert_not_called()
+
+def test_plan_crs_reprojection_prompts_once(mocker):
+    conn = MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchall.return_value = [('roads', 25833), ('parks', 4326)]
+    table_groups = {
+        'roads': [{'file': 'roads_1.gpkg', 'crs': 'EPSG:4326'}, {'file': 'roads_2.gpkg', 'crs': 'EPSG:4326'}],
+        'parks': [{'file': 'parks.gpkg', 'crs': 'EPSG:4326'}],
+        'lakes': [{'file': 'lakes.gpkg', 'crs': 'EPSG:4326'}],
+    }
+    mock_input = mocker.patch('dbfriend.dbfriend.console.input', return_value='y')
+    args = MagicMock(epsg=None, overwrite=False)
+
+    result = plan_crs_reprojection(conn, table_groups, {'roads', 'parks'}, args, 'public')
+
+    mock_input.assert_called_once()
+    assert set(result) == {'roads', 'parks', 'lakes'}
+    assert [info['target_epsg'] for info in result['roads']] == [25833, 25833]
+    assert 'target_epsg' not in result['parks'][0]
+
+    mock_input.return_value = 'n'
+    for info in table_groups['roads']:
+        del info['target_epsg']
+    result = plan_crs_reprojection(conn, table_groups, {'roads', 'parks'}, args, 'public')
+    assert set(result) == {'parks', 'lakes'}
+
+def test_plan_crs_reprojection_uses_known_srids(mocker):
+    conn = MagicMock()
+    table_groups = {'roads': [{'file': 'roads.gpkg', 'crs': 'EPSG:4326'}]}
+    mocker.patch('dbfriend.dbfriend.console.input', return_value='y')
+    args = MagicMock(epsg=None, overwrite=False)
+
+    result = plan_crs_reprojection(conn, table_groups, {'roads'}, args, 'public',
+                                   table_srids={'roads': 25833, 'parks': None})
+
+    conn.cursor.assert_not_called()
+    assert result['roads'][0]['target_epsg'] == 25833
+
+def test_compute_file_digest_includes_sidecars(tmp_path):
+    (tmp_path / 'roads.shp').write_bytes(b'shp')
+    (tmp_path / 'roads.dbf').write_bytes(b'dbf')
+    before = compute_file_digest(str(tmp_path / 'roads.shp'))
+
+    (tmp_path / 'roads.dbf').write_bytes(b'changed')
+
+    assert compute_file_digest(str(tmp_path / 'roads.shp')) != before
+
+def test_skip_unchanged_files(tmp_path):
+    for name in ('roads.geojson', 'parks.geojson', 'lakes.geojson'):
+        (tmp_path / name).write_bytes(name.encode())
+    table_groups = {
+        name: [{'file': f'{name}.geojson', 'full_path': str(tmp_path / f'{name}.geojson')}]
+        for name in ('roads', 'parks', 'lakes')
+    }
+    conn = MagicMock()
+    cursor = conn.cursor.return_value.__enter__.return_value
+    cursor.fetchall.return_value = [
+        ('roads', 'roads.geojson', compute_file_digest(str(tmp_path / 'roads.geojson'))),
+        ('parks', 'parks.geojson', 'stale'),
+        ('lakes', 'lakes.geojson', compute_file_digest(str(tmp_path / 'lakes.geojson'))),
+    ]
+
+    # lakes matches its digest but its table is gone, so it is loaded again
+    result = skip_unchanged_files(conn, table_groups, {'roads', 'parks'}, 'public')
+
+    assert set(result) == {'parks', 'lakes'}
+    assert result['parks'][0]['digest'] == compute_file_digest(str(tmp_path / 'parks.geojson'))
+    conn.commit.assert_called_once()
+
+def test_skip_unchanged_files_force_leaves_digest_table_alone(db_mocks):
+    mock_conn, mock_cursor = db_mocks
+    table_groups = {'roads': [{'file': 'roads.geojson', 'full_path': 'roads.geojson'}]}
+
+    result = skip_unchanged_files(mock_conn, table_groups, {'roads'}, 'public', force=True)
+
+    assert result is table_groups
+    assert 'digest' not in table_groups['roads'][0]
+    mock_cursor.execute.assert_not_called()
+
+def test_skip_unchanged_files_without_digest_table(db_mocks, mock_logger):
+    mock_conn, mock_cursor = db_mocks
+    mock_cursor.execute.side_effect = [None, psycopg2.Error("permission denied for schema public"), None]
+    table_groups = {'roads': [{'file': 'roads.geojson', 'full_path': 'roads.geojson'}]}
+
+    result = skip_unchanged_files(mock_conn, table_groups, {'roads'}, 'public')
+
+    assert result is table_groups
+    assert mock_cursor.execute.call_args[0][0] == "ROLLBACK TO SAVEPOINT import_log"
+    assert "importing every file" in mock_logger.warning.call_args[0][0]
+    mock_conn.commit.assert_not_called()
+
+def test_record_file_digests_is_best_effort(db_mocks, mocker, mock_logger):
+    mock_conn, mock_cursor = db_mocks
+    mocker.patch('dbfriend.dbfriend.psycopg2.extras.execute_values',
+                 side_effect=psycopg2.Error("permission denied"))
+
+    record_file_digests(mock_conn, 'roads', [{'file': 'roads.geojson', 'digest': 'abc'}], 'public')
+
+    assert executed_sql(mock_cursor) == ['SAVEPOINT record_digests', 'ROLLBACK TO SAVEPOINT record_digests']
+    mock_logger.warning.assert_called_once()
+
+def test_assign_union_tables():
+    infos = [
+        {'table_name': 'roads_01', 'fields': ('name',), 'crs': 'EPSG:4326'},
+        {'table_name': 'roads_02', 'fields': ('name',), 'crs': 'EPSG:4326'},
+        {'table_name': 'parks', 'fields': ('name',), 'crs': 'EPSG:3857'},
+        {'table_name': '01', 'fields': ('id',), 'crs': 'EPSG:4326'},
+        {'table_name': '02', 'fields': ('id',), 'crs': 'EPSG:4326'},
+    ]
+
+    assign_union_tables(infos)
+
+    assert [info['table_name'] for info in infos] == ['roads', 'roads', 'parks', '01', '01']
+
+@pytest.mark.parametrize("file, expected", [
+    ('roads.shp', True),
+    ('ROADS.GeoJSON', True),
+    ('roads.shp.xml', False),
+    ('roads.dbf', False),
+])
+def test_supported_file_pattern(file, expected):
+    assert bool(SUPPORTED_FILE_PATTERN.search(file)) is expected
+
+def test_process_table_group_counts_appended_rows(mocker):
+    mock_conn = MagicMock()
+    gdf = GeoDataFrame({'geom': [_P00, _P11, _P22]}, geometry='geom', crs=_CRS_4326)
+    mocker.patch('dbfriend.dbfriend.read_spatial_files', return_value=[gdf])
+    mocker.patch('dbfriend.dbfriend.compare_geometries', return_value=(gdf, None, gdf.iloc[:0]))
+    # The COPY loaded fewer rows than compare_geometries found new
+    mocker.patch('dbfriend.dbfriend.append_new_geometries', return_value=2)
+    mocker.patch('dbfriend.dbfriend.record_file_digests')
+    args = MagicMock(table=None, coordinates=False)
+    infos = [{'file': 'roads.gpkg', 'full_path': 'roads.gpkg'}]
+
+    result = process_table_group(args, mock_conn, MagicMock(), MagicMock(), 'roads', infos, {'roads'},
+                                 'public', [], {'roads': 'geom'}, [], threading.Lock())
+
+    assert result == (2, 0, 0)
+
+def test_process_table_group_commits_new_table(db_mocks, mocker):
+    mock_conn, mock_cursor = db_mocks
+    gdf = GeoDataFrame({'name': ['a'], 'geom': [_P00]}, geometry='geom', crs=_CRS_4326)
+    mocker.patch('dbfriend.dbfriend.read_spatial_files', return_value=[gdf])
+    mocker.patch('dbfriend.dbfriend.record_file_digests')
+    mocker.patch('dbfriend.dbfriend.bulk_copy_geodataframe', return_value=1)
+    existing_tables, pending_indexes = set(), []
+    recorded_at_commit = []
+    mock_conn.commit.side_effect = lambda: recorded_at_commit.append(bool(existing_tables or pending_indexes))
+
+    result = process_table_group(MagicMock(table=None, coordinates=False), mock_conn, MagicMock(), MagicMock(),
+                                 'roads', [{'file': 'roads.gpkg'}], existing_tables, 'public', [], {},
+                                 pending_indexes, threading.Lock())
+
+    assert result == (1, 0, 0)
+    # The table is committed before it is recorded as imported; the digests follow in a second commit
+    assert recorded_at_commit == [False, True]
+    assert existing_tables == {'roads'}
+    assert [table for table, _, _ in pending_indexes] == ['roads']
+
+def test_process_table_group_skips_digests_after_failed_write(mocker):
+    mock_conn = MagicMock()
+    gdf = GeoDataFrame({'geom': [_P00, _P11]}, geometry='geom', crs=_CRS_4326)
+    mocker.patch('dbfriend.dbfriend.read_spatial_files', return_value=[gdf])
+    mocker.patch('dbfriend.dbfriend.compare_geometries', return_value=(gdf.iloc[:1], None, gdf.iloc[1:]))
+    mocker.patch('dbfriend.dbfriend.append_new_geometries', return_value=None)
+    mock_record = mocker.patch('dbfriend.dbfriend.record_file_digests')
+    args = MagicMock(table=None, coordinates=False)
+
+    result = process_table_group(args, mock_conn, MagicMock(), MagicMock(), 'roads', [{'file': 'roads.gpkg'}],
+                                 {'roads'}, 'public', [], {'roads': 'geom'}, [], threading.Lock())
+
+    # The identical row alone must not mark the file as imported
+    assert result == (0, 0, 1)
+    mock_record.assert_not_called()
+
+def test_process_table_group_loads_new_table_frozen(db_mocks, mocker):
+    mock_conn, mock_cursor = db_mocks
+    gdf = GeoDataFrame({'name': ['a'], 'geom': [_P00]}, geometry='geom', crs=_CRS_4326)
+    mocker.patch('dbfriend.dbfriend.read_spatial_files', return_value=[gdf])
+    mocker.patch('dbfriend.dbfriend.record_file_digests')
+    statements = []
+    mock_cursor.execute.side_effect = lambda sql, *params: statements.append(normalize_sql(sql))
+    mock_cursor.copy_expert.side_effect = lambda sql, buffer: statements.append(render_sql(sql))
+    mock_cursor.rowcount = 1
+    mock_conn.commit.side_effect = lambda: statements.append('COMMIT')
+
+    process_table_group(MagicMock(table=None, coordinates=False), mock_conn, MagicMock(), MagicMock(),
+                        'roads', [{'file': 'roads.gpkg'}], set(), 'public', [], {}, [], threading.Lock())
+
+    # Created and frozen-loaded in one transaction, with no UNLOGGED table or SET LOGGED rewrite
+    assert statements[:5] == [
+        'SAVEPOINT create_new_table',
+        'DROP TABLE IF EXISTS "public"."roads"',
+        'CREATE TABLE "public"."roads" ("name" TEXT, "geom" geometry(Point, 4326))',
+        'COPY "public"."roads" ("name", "geom") FROM STDIN WITH (FORMAT csv, NULL \'\\N\', FREEZE)',
+        'COMMIT',
+    ]
 
 # 14. Testing process_files_schema_handling
-def test_process_files_schema_handling():
+def test_process_files_schema_handling(patched_io, mocker):
     """Test process_files with schema specification"""
     mock_conn = MagicMock()
+    mock_engine = MagicMock()
     
     # Create a more complete mock args object
     args = MagicMock(
@@ -615,87 +1419,64 @@ def test_process_files_schema_handling():
         password='test_pass',
         host='localhost',
         port='5432',
-        filepath='test/path'  
+        filepath='test/path',
+        jobs=1,
+        union=False,
+        no_backup=True,
+        force=True,
+        coordinates=False
     )
+    mocker.patch('dbfriend.dbfriend.get_geometry_metadata', return_value={})
+    mocker.patch('dbfriend.dbfriend.get_non_essential_columns_bulk', return_value={})
+    mocker.patch('dbfriend.dbfriend.build_spatial_indexes')
+    mock_create = mocker.patch('dbfriend.dbfriend.create_generic_geometry_table', return_value=True)
+    mock_append = mocker.patch('dbfriend.dbfriend.append_geometries', return_value=1)
+
+    # Add the missing required arguments
+    existing_tables = set()
+    schema = 'custom'
     
-    # Create test GeoDataFrame
-    test_gdf = GeoDataFrame({'geometry': [Point(1, 1)]}, crs='EPSG:4326')
-    
-    # Mock os.listdir, create_engine and read_file
-    with patch('os.listdir', return_value=['test.shp']), \
-         patch('sqlalchemy.create_engine') as mock_create_engine, \
-         patch('geopandas.read_file', return_value=test_gdf):
-        
-        # Add the missing required arguments
-        existing_tables = []
-        schema = 'custom'
-        
-        process_files(args, mock_conn, mock_create_engine, existing_tables, schema)
+    result = process_files(args, mock_conn, mock_engine, existing_tables, schema)
+
+    # The file is read and its table created and loaded in the requested schema
+    _, read_dataframe = patched_io
+    assert read_dataframe.call_args[0][0] == 'test/path/test.shp'
+    mock_create.assert_called_once_with(mock_conn, mock_engine, 'test_table', 4326, 'custom')
+    mock_append.assert_called_once_with(mock_conn, ANY, 'test_table', 'custom')
+    assert existing_tables == {'test_table'}
+    assert result == (1, 0, 0)
 
 @pytest.mark.integration
-def test_mixed_geometry_types():
+def test_mixed_geometry_types(pg_conn):
     """Test handling of mixed geometry types in a single table"""
-    if not all([
-        os.getenv('TEST_DB_NAME'),
-        os.getenv('TEST_DB_USER'),
-        os.getenv('TEST_DB_PASS')
-    ]):
-        pytest.skip("Test database credentials not configured")
-    
-    cursor = None
-    conn = None
+    conn = pg_conn
     test_table = 'test_mixed_geometries'
     schema = 'public'
     
     try:
-        # Setup database connection
-        conn = psycopg2.connect(
-            dbname=os.getenv('TEST_DB_NAME'),
-            user=os.getenv('TEST_DB_USER'),
-            password=os.getenv('TEST_DB_PASS'),
-            host=os.getenv('TEST_DB_HOST', 'localhost'),
-            port=os.getenv('TEST_DB_PORT', '5432')
-        )
-        
-        cursor = conn.cursor()
-        
-        # Ensure PostGIS extension is enabled
-        cursor.execute("CREATE EXTENSION IF NOT EXISTS postgis;")
-        conn.commit()
-
-        # Create test table with generic geometry
-        cursor.execute(f"""
-            DROP TABLE IF EXISTS {schema}.{test_table};
-            CREATE TABLE {schema}.{test_table} (
-                id SERIAL PRIMARY KEY,
-                geometry geometry(Geometry, 4326)  -- Changed from 'geom' to 'geometry'
-            );
-        """)
+        with conn.cursor() as cursor:
+            # Create test table with generic geometry
+            cursor.execute(f"""
+                DROP TABLE IF EXISTS {schema}.{test_table};
+                CREATE TABLE {schema}.{test_table} (
+                    id SERIAL PRIMARY KEY,
+                    geometry geometry(Geometry, 4326)  -- Changed from 'geom' to 'geometry'
+                );
+            """)
         conn.commit()
 
         # Create test data
         point_gdf = GeoDataFrame({
-            'geometry': [Point(0, 0), Point(1, 1)]
-        }, crs='EPSG:4326')
+            'geometry': shapely.points(np.array([[0, 0], [1, 1]]))
+        }, crs=_CRS_4326)
         
-        # Create SQLAlchemy engine
-        engine = create_engine(
-            f'postgresql://{os.getenv("TEST_DB_USER")}:{os.getenv("TEST_DB_PASS")}'
-            f'@{os.getenv("TEST_DB_HOST", "localhost")}:{os.getenv("TEST_DB_PORT", "5432")}'
-            f'/{os.getenv("TEST_DB_NAME")}'
-        )
-        
-        # Insert the data
-        point_gdf.to_postgis(
-            test_table,
-            engine,
-            if_exists='append',
-            index=False
-        )
+        # Insert the data through the same COPY path dbfriend loads tables with
+        bulk_copy_geodataframe(conn, point_gdf, test_table, schema)
 
         # Verify count
-        cursor.execute(f"SELECT COUNT(*) FROM {schema}.{test_table}")
-        count = cursor.fetchone()[0]
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {schema}.{test_table}")
+            count = cursor.fetchone()[0]
         assert count == 2, f"Expected 2 geometries, found {count}"
 
     except Exception as e:
@@ -703,9 +1484,7 @@ def test_mixed_geometry_types():
 
     finally:
         # Cleanup
-        if cursor:
+        conn.rollback()
+        with conn.cursor() as cursor:
             cursor.execute(f"DROP TABLE IF EXISTS {schema}.{test_table}")
-            conn.commit()
-            cursor.close()
-        if conn:
-            conn.close()
\ No newline at end of file
+        conn.commit()